@@ -0,0 +1,12 @@
+"""
+Performance benchmarks of the library. Benchmarks are not a part of the
+test suite and are not shipped with the package. Run each module
+standalone, e.g.::
+
+    python -m benchmarks.statement_cache
+
+Request lifecycle scenarios can also run with pytest-benchmark::
+
+    pytest benchmarks/bench_lifecycle.py
+
+"""
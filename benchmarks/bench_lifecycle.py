@@ -0,0 +1,36 @@
+"""
+pytest-benchmark entry point of :mod:`benchmarks.lifecycle` scenarios for
+the representative mixin combinations::
+
+    pytest benchmarks/bench_lifecycle.py
+
+"""
+import itertools
+
+import pytest
+
+from benchmarks.lifecycle import (
+    COMBINATIONS,
+    SCENARIOS,
+    combination_name,
+    prepare_scenario,
+)
+
+
+@pytest.mark.parametrize('mixins', COMBINATIONS, ids=combination_name)
+@pytest.mark.parametrize('name', list(SCENARIOS))
+def test_lifecycle(benchmark, name, mixins):
+    prepared = prepare_scenario(name, mixins)
+    if prepared is None:
+        pytest.skip('Scenario requires another mixin combination.')
+    env, func = prepared
+    with env:
+        prepare, op = func(env)
+        counter = itertools.count()
+
+        def setup():
+            i = next(counter)
+            if prepare is not None:
+                prepare(i)
+            return (i,), {}
+        benchmark.pedantic(op, setup=setup, rounds=200, warmup_rounds=10)
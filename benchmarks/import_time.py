@@ -0,0 +1,56 @@
+"""
+Measure the import time of the package with ``python -X importtime`` in
+fresh interpreters, and show the slowest imports it pulls in::
+
+    python -m benchmarks.import_time [module] [runs]
+
+Requires Python 3.7+.
+"""
+import statistics
+import subprocess
+import sys
+
+
+def import_times(module):
+    """ Import the module in a new interpreter and return a dict of
+    (self, cumulative) import times in microseconds by module name. """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main(argv=sys.argv):
+    module = argv[1] if len(argv) > 1 else 'pyramid_sqlalchemy_sessions'
+    runs = int(argv[2]) if len(argv) > 2 else 10
+    # The first run warms up the bytecode and OS file caches.
+    import_times(module)
+    samples = [import_times(module) for _ in range(runs)]
+    totals = [times[module][1] for times in samples]
+    print('%s: median %.1f ms, min %.1f ms over %d runs' % (
+        module,
+        statistics.median(totals) / 1000,
+        min(totals) / 1000,
+        runs,
+    ))
+    last = samples[-1]
+    slowest = sorted(last.items(), key=lambda i: -i[1][1])[:20]
+    for name, (self_us, cumulative_us) in slowest:
+        print('%10.1f ms %10.1f ms  %s' % (
+            cumulative_us / 1000,
+            self_us / 1000,
+            name,
+        ))
+
+
+if __name__ == '__main__':
+    main()
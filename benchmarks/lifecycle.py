@@ -0,0 +1,375 @@
+"""
+Measure the full request lifecycle of the session: factory call, cookie
+decryption, load, commit hooks and response callbacks, for several
+scenarios and model mixin combinations on in-memory SQLite. Reports
+throughput and peak memory allocated per operation::
+
+    python -m benchmarks.lifecycle [--all] [-n ITERATIONS]
+        [-s SETTING=VALUE ...] [scenario ...]
+
+``--all`` runs every mixin combination instead of a representative
+selection, ``-s`` overrides session settings (e.g.
+``-s core_persistence=true``). Compare the overhead of the transaction
+manager by running with ``-s persistence_mode=callback``: requests then use
+a dbsession which isn't joined to a transaction manager.
+"""
+import argparse
+import itertools
+import os
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+
+import transaction
+import zope.sqlalchemy
+from pyramid import testing
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+import pyramid_sqlalchemy_sessions.gc as gc_module
+import pyramid_sqlalchemy_sessions.session as session_module
+from pyramid_sqlalchemy_sessions.gc import Cleaner
+from pyramid_sqlalchemy_sessions.model import (
+    AbsoluteMixin,
+    BaseMixin,
+    CSRFMixin,
+    ConfigAbsoluteMixin,
+    ConfigCookieMixin,
+    ConfigIdleMixin,
+    ConfigRenewalMixin,
+    IdleMixin,
+    RenewalMixin,
+    UseridMixin,
+)
+from pyramid_sqlalchemy_sessions.serializer import AESGCMBytestore
+from pyramid_sqlalchemy_sessions.session import get_session_factory
+
+
+IDLE_TIMEOUT = 300
+EXTENSION_DELAY = 60
+ABSOLUTE_TIMEOUT = 365 * 24 * 3600
+RENEWAL_TIMEOUT = 3600
+GC_ROWS = 100
+
+# Mixin variants of each feature. None means the feature is disabled.
+FEATURES = (
+    (None, UseridMixin),
+    (None, CSRFMixin),
+    (None, ConfigCookieMixin),
+    (None, IdleMixin, ConfigIdleMixin),
+    (None, AbsoluteMixin, ConfigAbsoluteMixin),
+    (None, RenewalMixin, ConfigRenewalMixin),
+)
+
+COMBINATIONS = (
+    (),
+    (UseridMixin, CSRFMixin),
+    (IdleMixin,),
+    (IdleMixin, AbsoluteMixin, RenewalMixin),
+    (ConfigCookieMixin, ConfigIdleMixin, ConfigAbsoluteMixin,
+     ConfigRenewalMixin),
+    (UseridMixin, CSRFMixin, ConfigCookieMixin, ConfigIdleMixin,
+     ConfigAbsoluteMixin, ConfigRenewalMixin),
+)
+
+
+def all_combinations():
+    for variants in itertools.product(*FEATURES):
+        yield tuple(mixin for mixin in variants if mixin is not None)
+
+
+def combination_name(mixins):
+    if not mixins:
+        return 'base'
+    names = (mixin.__name__[:-len('Mixin')].lower() for mixin in mixins)
+    return '+'.join(names)
+
+
+def model_class(mixins):
+    Base = declarative_base()
+    return type(
+        'BenchSession',
+        tuple(mixins) + (BaseMixin, Base),
+        {'__tablename__': 'bench_session'},
+    )
+
+
+def timeout_settings(cls):
+    settings = {}
+    if issubclass(cls, IdleMixin):
+        settings['idle_timeout'] = IDLE_TIMEOUT
+        settings['extension_delay'] = EXTENSION_DELAY
+    if issubclass(cls, AbsoluteMixin):
+        settings['absolute_timeout'] = ABSOLUTE_TIMEOUT
+    if issubclass(cls, RenewalMixin):
+        settings['renewal_timeout'] = RENEWAL_TIMEOUT
+    return settings
+
+
+class Response():
+    """ Response stand-in storing cookies in the cookie jar of a client. """
+    vary = None
+
+    def __init__(self, cookies):
+        self.cookies = cookies
+
+    def set_cookie(self, name, value, **kw):
+        self.cookies[name] = value
+
+    def delete_cookie(self, name, **kw):
+        self.cookies.pop(name, None)
+
+
+class Environment():
+    """ Session factory using a fresh in-memory database and a manual
+    clock. """
+    def __init__(self, mixins, **settings):
+        self.model_class = model_class(mixins)
+        self.engine = create_engine('sqlite://')
+        self.model_class.metadata.create_all(self.engine)
+        self.dbsession_factory = sessionmaker(bind=self.engine)
+        self.settings = timeout_settings(self.model_class)
+        self.settings.update(settings)
+        self.factory = get_session_factory(
+            AESGCMBytestore(os.urandom(32)),
+            self.model_class,
+            **self.settings
+        )
+        self.now = int(time.time())
+        self.cookies = {}
+
+    def __enter__(self):
+        self._config = testing.setUp()
+        self._int_now = session_module.int_now
+        session_module.int_now = gc_module.int_now = lambda: self.now
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        session_module.int_now = gc_module.int_now = self._int_now
+        self.engine.dispose()
+        testing.tearDown()
+
+    def request(self, view, cookies=None):
+        """ Run a request calling the view with the session, using and
+        updating client cookies (the default client unless provided). """
+        if cookies is None:
+            cookies = self.cookies
+        request = testing.DummyRequest(cookies=dict(cookies))
+        request.dbsession = self.dbsession_factory()
+        if self.settings.get('persistence_mode') == 'callback':
+            view(self.factory(request))
+        else:
+            request.tm = transaction.TransactionManager(explicit=True)
+            zope.sqlalchemy.register(
+                request.dbsession,
+                transaction_manager=request.tm,
+            )
+            with request.tm:
+                view(self.factory(request))
+        request._process_response_callbacks(Response(cookies))
+        request.dbsession.close()
+
+    def transaction(self):
+        tm = transaction.TransactionManager(explicit=True)
+        dbsession = self.dbsession_factory()
+        zope.sqlalchemy.register(dbsession, transaction_manager=tm)
+        return tm, dbsession
+
+
+def read(session):
+    session.get('key')
+
+
+def write(session):
+    session['key'] = session.get('key', 0) + 1
+
+
+def invalidate(session):
+    session.invalidate()
+
+
+SCENARIOS = OrderedDict()
+
+
+def scenario(requires=BaseMixin, **settings):
+    """ Register scenario function returning ``(prepare, op)`` callables of
+    the iteration number. ``prepare`` runs untimed before each ``op``. """
+    def decorator(func):
+        func.requires = requires
+        func.settings = settings
+        SCENARIOS[func.__name__] = func
+        return func
+    return decorator
+
+
+@scenario()
+def anonymous(env):
+    """ New session is read, but not created. """
+    return None, lambda i: env.request(read, cookies={})
+
+
+@scenario()
+def create(env):
+    """ New session is created by a write. """
+    return None, lambda i: env.request(write, cookies={})
+
+
+@scenario()
+def read_only(env):
+    """ Existing session is read without any writes. """
+    env.request(write)
+    return None, lambda i: env.request(read)
+
+
+@scenario()
+def update(env):
+    """ Existing session data is changed. """
+    env.request(write)
+    return None, lambda i: env.request(write)
+
+
+@scenario(requires=RenewalMixin, idle_timeout=None, extension_delay=None,
+          renewal_timeout=EXTENSION_DELAY)
+def renewal(env):
+    """ Every read of existing session starts or finishes the renewal. """
+    env.request(write)
+
+    def op(i):
+        env.now += EXTENSION_DELAY + 1
+        env.request(read)
+    return None, op
+
+
+@scenario(requires=IdleMixin, renewal_timeout=None)
+def extension(env):
+    """ Every read of existing session extends the idle timeout. """
+    env.request(write)
+
+    def op(i):
+        env.now += EXTENSION_DELAY + 1
+        env.request(read)
+    return None, op
+
+
+@scenario()
+def invalidation(env):
+    """ Existing session is invalidated. """
+    cookies = {}
+
+    def prepare(i):
+        cookies.clear()
+        env.request(write, cookies)
+    return prepare, lambda i: env.request(invalidate, cookies)
+
+
+@scenario(requires=IdleMixin)
+def gc(env):
+    """ GC run deleting expired sessions. """
+    env.request(write)
+    table = env.model_class.__table__
+    with env.engine.connect() as conn:
+        template = dict(conn.execute(table.select()).first())
+    settings = dict(env.settings, model_class=env.model_class)
+    settings.setdefault('statement_cache', True)
+    settings.setdefault('absolute_timeout', None)
+
+    def prepare(i):
+        rows = []
+        for n in range(GC_ROWS):
+            row = dict(template, idle_expire=env.now - 1)
+            row['id'] = uuid.UUID(bytes=os.urandom(16))
+            rows.append(row)
+        with env.engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+
+    def op(i):
+        tm, dbsession = env.transaction()
+        with tm:
+            Cleaner.delete_query(dbsession, settings)
+        dbsession.close()
+    return prepare, op
+
+
+def prepare_scenario(name, mixins, **settings):
+    """ Return environment and scenario callables, or None if the scenario
+    doesn't apply to the mixin combination. """
+    func = SCENARIOS[name]
+    if not any(issubclass(m, func.requires) for m in (BaseMixin,) + mixins):
+        return None
+    env = Environment(mixins, **dict(func.settings, **settings))
+    return env, func
+
+
+def measure(prepare, op, iterations, alloc_iterations):
+    """ Return ops per second and peak KiB allocated per op. """
+    elapsed = 0.0
+    counter = itertools.count()
+    for n in range(iterations):
+        i = next(counter)
+        if prepare is not None:
+            prepare(i)
+        start = time.perf_counter()
+        op(i)
+        elapsed += time.perf_counter() - start
+    peak = 0
+    tracemalloc.start()
+    try:
+        for n in range(alloc_iterations):
+            i = next(counter)
+            if prepare is not None:
+                prepare(i)
+            tracemalloc.clear_traces()
+            op(i)
+            peak += tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return iterations / elapsed, peak / alloc_iterations / 1024
+
+
+def parse_setting(value):
+    name, sep, setting = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('Expected SETTING=VALUE: %s' % value)
+    return name, setting
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=', '.join(SCENARIOS))
+    parser.add_argument('--all', action='store_true')
+    parser.add_argument('-n', '--iterations', type=int, default=500)
+    parser.add_argument('-s', '--setting', type=parse_setting, action='append',
+                        default=[])
+    args = parser.parse_args(argv)
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error('Unknown scenario: %s' % name)
+    combinations = all_combinations() if args.all else COMBINATIONS
+    settings = dict(args.setting)
+    alloc_iterations = max(1, args.iterations // 10)
+    print('%-14s %-66s %10s %10s' % ('scenario', 'mixins', 'ops/s', 'KiB/op'))
+    for mixins in combinations:
+        for name in names:
+            prepared = prepare_scenario(name, mixins, **settings)
+            if prepared is None:
+                continue
+            env, func = prepared
+            with env:
+                prepare, op = func(env)
+                ops, kib = measure(
+                    prepare,
+                    op,
+                    args.iterations,
+                    alloc_iterations,
+                )
+            print('%-14s %-66s %10.0f %10.1f' % (
+                name, combination_name(mixins), ops, kib
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Demonstrate the effect of the ``statement_cache`` setting: count SQL
+compilations and measure throughput of the primary key load and the GC
+delete, with and without statement caching.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import compiler
+
+from pyramid_sqlalchemy_sessions.core import get_statements
+from pyramid_sqlalchemy_sessions.gc import Cleaner
+from pyramid_sqlalchemy_sessions.model import (
+    BaseMixin,
+    IdleMixin,
+)
+
+
+Base = declarative_base()
+
+
+class BenchSession(IdleMixin, BaseMixin, Base):
+    __tablename__ = 'bench_session'
+
+
+class CompileCounter():
+    """ Count SQL compiler instantiations, i.e. statement compilations. """
+    def __init__(self):
+        self.count = 0
+
+    @contextmanager
+    def counting(self):
+        init = compiler.SQLCompiler.__init__
+
+        def counting_init(compiler_self, *arg, **kw):
+            self.count += 1
+            init(compiler_self, *arg, **kw)
+        compiler.SQLCompiler.__init__ = counting_init
+        try:
+            yield self
+        finally:
+            compiler.SQLCompiler.__init__ = init
+
+
+def setup(rows):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    dbsession = sessionmaker(bind=engine)()
+    ids = [uuid.uuid4() for _ in range(rows)]
+    for id in ids:
+        dbsession.add(BenchSession(
+            id=id,
+            created=0,
+            data={'key': 'value'},
+            flash={},
+            idle_expire=2 ** 30,
+        ))
+    dbsession.commit()
+    return dbsession, ids
+
+
+def bench(name, func, iterations):
+    counter = CompileCounter()
+    with counter.counting():
+        start = time.perf_counter()
+        for i in range(iterations):
+            func(i)
+        elapsed = time.perf_counter() - start
+    print('%-28s %10.0f ops/s %8.2f compilations/op' % (
+        name, iterations / elapsed, counter.count / iterations
+    ))
+
+
+def main(iterations=2000):
+    dbsession, ids = setup(100)
+    statements = get_statements(BenchSession)
+
+    def orm_load(i):
+        dbsession.query(BenchSession).get(ids[i % len(ids)])
+        dbsession.expunge_all()
+
+    def baked_load(i):
+        statements.load_instance(dbsession, ids[i % len(ids)])
+        dbsession.expunge_all()
+
+    def core_load(i):
+        conn = statements.connection(dbsession)
+        statements.load_record(conn, ids[i % len(ids)])
+
+    def gc(cached):
+        settings = {
+            'model_class': BenchSession,
+            'statement_cache': cached,
+            'idle_timeout': 300,
+            'absolute_timeout': None,
+        }
+
+        def delete(i):
+            Cleaner.delete_query(dbsession, settings)
+        return delete
+
+    bench('load: Query.get', orm_load, iterations)
+    bench('load: baked query', baked_load, iterations)
+    bench('load: core statement', core_load, iterations)
+    bench('gc: Query.delete', gc(False), iterations)
+    bench('gc: cached statement', gc(True), iterations)
+    dbsession.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,18 @@
 from .authn import UserSessionAuthenticationPolicy
+from .breaker import CircuitBreaker
+from .bulk import (
+    invalidate_user_sessions,
+    iter_sessions,
+    list_user_sessions,
+    load_many,
+)
 from .config import (
     factory_args_from_settings,
     generate_secret_key,
 )
 from .events import (
+    BreakerClosedEvent,
+    BreakerOpenedEvent,
     CookieCryptoErrorEvent,
     InvalidCookieErrorEvent,
     RenewalViolationEvent,
@@ -13,6 +22,7 @@ from .exceptions import (
     CookieCryptoError,
     InconsistentDataError,
     InvalidCookieError,
+    SessionConflictError,
     SettingsError,
 )
 from .model import (
@@ -24,21 +34,36 @@ from .model import (
     ConfigIdleMixin,
     ConfigRenewalMixin,
     FullyFeaturedSession,
+    HMACRenewalMixin,
     IdleMixin,
+    IndexedUseridMixin,
+    KeyValueDataMixin,
+    PartitionedMixin,
     RenewalMixin,
     UseridMixin,
+    VersionMixin,
 )
 from .session import get_session_factory
+from .tenants import SessionFactoryRegistry
+from .util import CoarseClock
 
 
 __all__ = ['factory_args_from_settings', 'generate_secret_key',
-           'get_session_factory', 'UserSessionAuthenticationPolicy',
+           'get_session_factory', 'invalidate_user_sessions',
+           'iter_sessions', 'list_user_sessions', 'load_many',
+           'UserSessionAuthenticationPolicy',
+           'CircuitBreaker', 'CoarseClock', 'SessionFactoryRegistry',
            'FullyFeaturedSession', 'AbsoluteMixin', 'BaseMixin', 'CSRFMixin',
            'ConfigAbsoluteMixin', 'ConfigCookieMixin', 'ConfigIdleMixin',
-           'ConfigRenewalMixin', 'IdleMixin', 'RenewalMixin', 'UseridMixin',
+           'ConfigRenewalMixin', 'HMACRenewalMixin', 'IdleMixin',
+           'IndexedUseridMixin',
+           'KeyValueDataMixin', 'PartitionedMixin',
+           'RenewalMixin', 'UseridMixin', 'VersionMixin',
+           'BreakerClosedEvent', 'BreakerOpenedEvent',
            'CookieCryptoErrorEvent', 'InvalidCookieErrorEvent',
            'RenewalViolationEvent', 'ConfigurationError', 'CookieCryptoError',
-           'InconsistentDataError', 'InvalidCookieError', 'SettingsError']
+           'InconsistentDataError', 'InvalidCookieError',
+           'SessionConflictError', 'SettingsError']
 
 
 def includeme(config):
@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+class CircuitBreaker():
+    """
+    Per-process circuit breaker of session DB operations: loads of sessions
+    and writes persisting them.
+
+    The breaker opens after ``failures`` consecutive operations either
+    raised a database error or took longer than ``latency`` seconds. While
+    it's open, sessions are served empty and their changes are discarded,
+    without touching the DB. After ``recovery`` seconds one request is let
+    through to try the DB again: the breaker closes if its operations
+    succeed, otherwise it stays open for another ``recovery`` seconds.
+
+    Use the instance as the ``circuit_breaker`` setting, and subscribe to
+    :class:`.BreakerOpenedEvent` and :class:`.BreakerClosedEvent` to
+    monitor transitions.
+    """
+    def __init__(self, failures=5, latency=1, recovery=30,
+                 clock=time.monotonic):
+        self.failures = failures
+        self.latency = latency
+        self.recovery = recovery
+        self._clock = clock
+        self._failed = 0
+        self._opened = None
+        self._lock = threading.Lock()
+
+    @property
+    def open(self):
+        """ True while the breaker is open, including trial requests. """
+        return self._opened is not None
+
+    def allow(self):
+        """ Return True if the request may use the DB. """
+        if self._opened is None:
+            return True
+        with self._lock:
+            if self._opened is None:
+                return True
+            now = self._clock()
+            if now - self._opened < self.recovery:
+                return False
+            # Let a single trial request through, and keep rejecting the
+            # others for another recovery period.
+            self._opened = now
+            return True
+
+    def record(self, duration, exception=None):
+        """ Record the outcome of a DB operation. Return ``'opened'`` or
+        ``'closed'`` on a transition of the breaker, otherwise None. """
+        failed = exception is not None or duration > self.latency
+        if not failed and self._failed == 0 and self._opened is None:
+            return None
+        with self._lock:
+            if not failed:
+                self._failed = 0
+                if self._opened is None:
+                    return None
+                self._opened = None
+                return 'closed'
+            self._failed += 1
+            if self._opened is not None:
+                # The trial request failed.
+                self._opened = self._clock()
+            elif self._failed >= self.failures:
+                self._opened = self._clock()
+                return 'opened'
+            return None
@@ -0,0 +1,148 @@
+from sqlalchemy import bindparam
+from zope.sqlalchemy import mark_changed
+
+from .core import (
+    KeyValueData,
+    SessionRow,
+    get_statements,
+)
+from .exceptions import ConfigurationError
+
+
+def _user_statements(model_class):
+    statements = get_statements(model_class)
+    if statements.user_statements is None:
+        raise ConfigurationError(
+            "Model should inherit from UseridMixin for operations on"
+            " sessions of a user."
+        )
+    return statements
+
+
+def list_user_sessions(dbsession, model_class, userid):
+    """
+    Return session model instances of the user, oldest first.
+
+    Use :class:`.IndexedUseridMixin` to avoid a table scan.
+    """
+    _user_statements(model_class)
+    return dbsession.query(model_class) \
+        .filter(model_class.userid == userid) \
+        .order_by(model_class.created) \
+        .all()
+
+
+def invalidate_user_sessions(dbsession, model_class, userid, keep=None,
+                             tm=None):
+    """
+    Delete all sessions of the user using a single statement, e.g. to log
+    the user out everywhere after a password change. Return the number of
+    deleted sessions.
+
+    Arguments:
+
+    dbsession
+        SQLAlchemy session joined to the transaction (**required**)
+    model_class
+        session :term:`model` using :class:`.UseridMixin` (**required**)
+    userid
+        user ID (**required**)
+    keep
+        session of the current request to keep, e.g. ``request.session``.
+        Deleting the loaded session of the current request otherwise fails
+        on commit when the session is changed.
+    tm
+        transaction manager of ``dbsession``, when it's not the default
+        thread-local manager (e.g. ``request.tm`` of ``pyramid_tm``)
+
+    Use :class:`.IndexedUseridMixin` to avoid a table scan. Sessions are
+    deleted in the transaction, so they are invalidated only if it commits.
+    """
+    statements = _user_statements(model_class)
+    keep_id = None
+    if keep is not None and not keep.new:
+        keep_id = keep._session.id
+    conn = statements.connection(dbsession)
+    deleted = statements.user_statements.delete_sessions(conn, userid, keep_id)
+    if tm is None:
+        mark_changed(dbsession)
+    else:
+        mark_changed(dbsession, tm)
+    return deleted
+
+
+def _data_loader(statements, conn):
+    """ Return function decoding session data of a scanned row. """
+    data_statements = statements.data_statements
+    if data_statements is not None:
+        pk_key = statements.pk_key
+        return lambda row: KeyValueData(
+            lambda: data_statements.load_rows(conn, row[pk_key])
+        )
+    loads = statements.data_loads
+    if loads is None:
+        return lambda row: None
+
+    def load_data(row):
+        raw = row['data']
+        return None if raw is None else loads(raw)
+    return load_data
+
+
+def iter_sessions(dbsession, model_class, filter=None, batch_size=1000):
+    """
+    Iterate over sessions of the model matching the filter clause, e.g.
+    ``MySession.userid == userid``, in primary key order. Yield read-only
+    :class:`.SessionRow` rows.
+
+    Rows are read ``batch_size`` at a time, each batch by a query
+    continuing after the last primary key of the previous one, so memory
+    use doesn't grow with the number of sessions. Session data is decoded
+    only when ``data`` of a row is accessed, so rows can be filtered by
+    their columns first, e.g. to scan sessions holding a data key::
+
+      for row in iter_sessions(dbsession, MySession):
+          if 'cart' in row.data:
+              ...
+
+    Sessions changed during the iteration may be missed or seen in their
+    new state.
+    """
+    statements = get_statements(model_class)
+    pk = statements.table.c[statements.pk_column_key]
+    pk_key = statements.pk_key
+    query = statements.scan.order_by(pk).limit(batch_size)
+    if filter is not None:
+        query = query.where(filter)
+    next_query = query.where(pk > bindparam('_last'))
+    conn = dbsession.connection()
+    load_data = _data_loader(statements, conn)
+    rows = conn.execute(query).fetchall()
+    while rows:
+        for row in rows:
+            yield SessionRow(row, load_data)
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][pk_key]
+        rows = conn.execute(next_query, {'_last': last}).fetchall()
+
+
+def load_many(dbsession, model_class, ids):
+    """
+    Load sessions by their ids using a single query. Return a dict of
+    read-only :class:`.SessionRow` rows by id, leaving out missing
+    sessions. Session data is decoded only when ``data`` of a row is
+    accessed.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+    statements = get_statements(model_class)
+    pk = statements.table.c[statements.pk_column_key]
+    conn = dbsession.connection()
+    load_data = _data_loader(statements, conn)
+    result = conn.execute(statements.scan.where(pk.in_(ids)))
+    return {
+        row[statements.pk_key]: SessionRow(row, load_data)
+        for row in result
+    }
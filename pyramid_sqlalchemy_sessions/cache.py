@@ -0,0 +1,38 @@
+import threading
+from collections import OrderedDict
+
+
+class MemoryCache():
+    """ Process-local cache with the minimal interface expected from cache
+    clients by the library: ``get(key)`` returning None for missing keys,
+    ``set(key, value)`` and ``delete(key)``.
+
+    The cache is bounded: when ``max_size`` is reached, least recently used
+    keys are evicted. It's a stand-in for a real cache server client, and
+    is only suitable for single process deployments and testing.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+default_cache = MemoryCache()
@@ -7,11 +7,17 @@ from pyramid.compat import (
 from sqlalchemy import inspect
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.orm.mapper import Mapper
+from ..cache import default_cache
 from ..serializer import (
     AESGCMBytestore,
     SECRET_SIZES,
 )
 from ..exceptions import ConfigurationError
+from ..partitions import PARTITION_KEYS
+from ..profiling import (
+    PROFILE_ENV,
+    PROFILERS,
+)
 from ..model import (
     AbsoluteMixin,
     BaseMixin,
@@ -20,22 +26,36 @@ from ..model import (
     ConfigCookieMixin,
     ConfigIdleMixin,
     ConfigRenewalMixin,
+    HMACRenewalMixin,
     IdleMixin,
+    KeyValueDataMixin,
+    PartitionedMixin,
     RenewalMixin,
     UseridMixin,
+    VersionMixin,
 )
 from .validators import (
     _validate_asbool,
+    _validate_breaker_none,
+    _validate_cache_none,
+    _validate_callable_none,
+    _validate_choice,
+    _validate_choice_none,
     _validate_cookie_domain,
     _validate_cookie_path,
+    _validate_engine_none,
+    _validate_extension_bucket,
     _validate_gt,
     _validate_int_none,
     _validate_nonzero_percent,
+    _validate_positive_int,
     _validate_positive_smallint,
     _validate_prob_extension,
+    _validate_probability,
     _validate_python_id,
     _validate_rfc2616_token,
     _validate_smallint_none,
+    none_variants,
 )
 
 
@@ -55,9 +75,32 @@ def get_config_defaults():
         'extension_delay': None,
         'extension_chance': 100,
         'extension_deadline': 1,
+        'extension_bucket': None,
+        'core_persistence': False,
+        'statement_cache': True,
+        'conflict_resolver': None,
+        'flash_storage': 'session',
+        'flash_cache': None,
+        'metrics': None,
+        'clock': None,
+        'profile': None,
+        'profile_chance': 0.01,
+        'profile_file': None,
+        'profile_interval': 60,
+        'partition_key': None,
+        'partition_interval': 604800,
+        'persistence_engine': None,
+        'circuit_breaker': None,
+        'persistence_mode': 'tm',
     }
 
 
+FLASH_STORAGES = ('session', 'cookie', 'cache')
+
+
+PERSISTENCE_MODES = ('tm', 'callback')
+
+
 RUNTIME_SETTINGS = (
     'cookie_max_age',
     'cookie_path',
@@ -145,6 +188,26 @@ def factory_args_from_settings(settings, maybe_dotted,
             " dotted Python name referencing the class."
         ) from e
     s['model_class'] = cls
+    # Resolve optional dotted names.
+    dotted = {
+        'conflict_resolver': 'a callable',
+        'flash_cache': 'a cache object',
+        'metrics': 'a callable',
+        'clock': 'a callable',
+        'persistence_engine': 'an SQLAlchemy engine',
+        'circuit_breaker': 'a circuit breaker',
+    }
+    for name, kind in dotted.items():
+        value = s[name]
+        if value in none_variants:
+            continue
+        try:
+            s[name] = maybe_dotted(value)
+        except (ValueError, ImportError) as e:
+            raise ConfigurationError(
+                "%s setting should contain %s or a dotted Python name"
+                " referencing it." % (name, kind)
+            ) from e
     return s
 
 
@@ -189,7 +252,8 @@ def _validate_config_settings(settings):
 def _process_factory_args(args):
     """
     Process factory args: validate and create new settings if needed.
-    Patch non-config mixins to pass timeout settings.
+    Settings are returned, model classes are never modified, so that
+    factories with different settings may share a model class.
     """
     s = args
 
@@ -202,11 +266,85 @@ def _process_factory_args(args):
             'cookie_name',
             s['cookie_name'],
         )
+        s['extension_bucket'] = _validate_smallint_none(
+            'extension_bucket',
+            s['extension_bucket'],
+        )
+        s['core_persistence'] = _validate_asbool(
+            'core_persistence',
+            s['core_persistence'],
+        )
+        s['statement_cache'] = _validate_asbool(
+            'statement_cache',
+            s['statement_cache'],
+        )
+        s['conflict_resolver'] = _validate_callable_none(
+            'conflict_resolver',
+            s['conflict_resolver'],
+        )
+        s['flash_storage'] = _validate_choice(
+            'flash_storage',
+            s['flash_storage'],
+            FLASH_STORAGES,
+        )
+        s['flash_cache'] = _validate_cache_none(
+            'flash_cache',
+            s['flash_cache'],
+        )
+        s['metrics'] = _validate_callable_none('metrics', s['metrics'])
+        s['clock'] = _validate_callable_none('clock', s['clock'])
+        if s['profile'] in none_variants:
+            # Allow profiling deployed apps without changing their config.
+            s['profile'] = os.environ.get(PROFILE_ENV)
+        s['profile'] = _validate_choice_none(
+            'profile',
+            s['profile'],
+            tuple(PROFILERS),
+        )
+        s['profile_chance'] = _validate_probability(
+            'profile_chance',
+            s['profile_chance'],
+        )
+        if s['profile_file'] in none_variants:
+            s['profile_file'] = None
+        s['profile_interval'] = _validate_positive_smallint(
+            'profile_interval',
+            s['profile_interval'],
+        )
+        s['partition_key'] = _validate_choice_none(
+            'partition_key',
+            s['partition_key'],
+            PARTITION_KEYS,
+        )
+        s['partition_interval'] = _validate_positive_int(
+            'partition_interval',
+            s['partition_interval'],
+        )
+        s['persistence_mode'] = _validate_choice(
+            'persistence_mode',
+            s['persistence_mode'],
+            PERSISTENCE_MODES,
+        )
+        s['persistence_engine'] = _validate_engine_none(
+            'persistence_engine',
+            s['persistence_engine'],
+        )
+        s['circuit_breaker'] = _validate_breaker_none(
+            'circuit_breaker',
+            s['circuit_breaker'],
+        )
         validated = _validate_config_settings(s)
         s.update(validated)
+        _validate_extension_bucket(
+            ('idle_timeout', 'extension_bucket'),
+            (s['idle_timeout'], s['extension_bucket']),
+        )
     except ValueError as e:
         raise ConfigurationError(e)
 
+    if s['flash_storage'] == 'cache' and s['flash_cache'] is None:
+        s['flash_cache'] = default_cache
+
     cls = s['model_class']
 
     if not issubclass(cls, BaseMixin):
@@ -217,6 +355,9 @@ def _process_factory_args(args):
     s['enable_userid'] = issubclass(cls, UseridMixin)
     s['enable_csrf'] = issubclass(cls, CSRFMixin)
     s['enable_configcookie'] = issubclass(cls, ConfigCookieMixin)
+    s['enable_version'] = issubclass(cls, VersionMixin)
+    s['enable_keyvalue'] = issubclass(cls, KeyValueDataMixin)
+    s['enable_hmac_renewal'] = issubclass(cls, HMACRenewalMixin)
 
     # Make sure model mixin configuration is compatible with enabled timeout
     # features.
@@ -243,8 +384,44 @@ def _process_factory_args(args):
                     msg_template % (timeout, mixin.__name__)
                 )
 
-    # Patch non-configurable mixins to help hybrid properties.
-    IdleMixin.idle_timeout = s['idle_timeout']
-    AbsoluteMixin.absolute_timeout = s['absolute_timeout']
+    if s['persistence_engine'] is not None:
+        if not s['core_persistence']:
+            raise ConfigurationError(
+                "persistence_engine requires core_persistence."
+            )
+        # Data rows are written by several statements, which would commit
+        # separately.
+        if s['enable_keyvalue']:
+            raise ConfigurationError(
+                "persistence_engine is not compatible with KeyValueDataMixin"
+            )
+
+    key = s['partition_key']
+    if issubclass(cls, PartitionedMixin) and key != cls.__partition_key__:
+        raise ConfigurationError(
+            "partition_key setting should match __partition_key__ of the"
+            " model class: %s" % cls.__partition_key__
+        )
+    if key is not None:
+        if s['absolute_timeout'] is None:
+            raise ConfigurationError(
+                "Partitioned session table requires absolute_timeout."
+            )
+        # Partitions by created are expired by the global timeout only.
+        if key == 'created' and s['config_absolute']:
+            raise ConfigurationError(
+                "partition_key created requires non-configurable absolute"
+                " timeout, use absolute_expire with ConfigAbsoluteMixin."
+            )
+        if key == 'absolute_expire' and not s['config_absolute']:
+            raise ConfigurationError(
+                "partition_key absolute_expire requires the model class to"
+                " inherit from ConfigAbsoluteMixin"
+            )
+        if s['enable_keyvalue']:
+            raise ConfigurationError(
+                "Partitioned session table is not compatible with"
+                " KeyValueDataMixin"
+            )
 
     return s
@@ -5,7 +5,6 @@ from ..config import (
     RUNTIME_SETTINGS,
 )
 from ..exceptions import SettingsError
-from ..util import int_now
 from .validators import _validate_int_none
 
 
@@ -50,7 +49,8 @@ class IdleTimeoutSetting(SessionSetting):
             if validated is None:
                 settings._dirty['idle_expire'] = None
             else:
-                settings._dirty['idle_expire'] = int_now() + value
+                now = settings.session._now()
+                settings._dirty['idle_expire'] = now + value
         except ValueError:
             pass
 
@@ -2,6 +2,7 @@ import itertools
 import string
 
 from pyramid.settings import asbool
+from sqlalchemy.engine import Engine
 
 
 none_variants = tuple(sorted(map(
@@ -41,6 +42,17 @@ def _validate_prob_extension(names, values):
         _validate_gt((names[3], names[1]), (dead, delay))
 
 
+def _validate_extension_bucket(names, values):
+    # Extensions of an active session may be up to twice the bucket apart.
+    idle, bucket = values
+    if idle is None or bucket is None:
+        return
+    if idle <= 2 * bucket:
+        raise ValueError(
+            '%s setting should be greater than twice %s' % names
+        )
+
+
 def _validate_cookie_domain(name, value):
     # Can't use none_variants because 'none' could be a valid string.
     if value is None:
@@ -92,6 +104,18 @@ def _validate_positive_smallint(name, value):
         ) from e
 
 
+def _validate_positive_int(name, value):
+    try:
+        i = int(value)
+        assert 0 < i <= MAX_INTEGER
+        return i
+    except (ValueError, AssertionError) as e:
+        raise ValueError(
+            'Setting should be a positive integer (max %d): %s'
+            % (MAX_INTEGER, name)
+        ) from e
+
+
 def _validate_nonzero_percent(name, value):
     try:
         percent = int(value)
@@ -103,6 +127,73 @@ def _validate_nonzero_percent(name, value):
     return percent
 
 
+def _validate_probability(name, value):
+    try:
+        probability = float(value)
+        assert 0 < probability <= 1
+    except (ValueError, AssertionError) as e:
+        raise ValueError(
+            'Setting should be an 0 < float <= 1: %s' % name
+        ) from e
+    return probability
+
+
+def _validate_callable_none(name, value):
+    if value in none_variants:
+        return None
+    if callable(value):
+        return value
+    raise ValueError('Setting should be a callable or None: %s' % name)
+
+
+def _validate_choice(name, value, choices):
+    if value in choices:
+        return value
+    raise ValueError(
+        'Setting should be one of %s: %s' % (', '.join(choices), name)
+    )
+
+
+def _validate_choice_none(name, value, choices):
+    if value in none_variants:
+        return None
+    return _validate_choice(name, value, choices)
+
+
+def _validate_cache_none(name, value):
+    if value in none_variants:
+        return None
+    methods = ('get', 'set', 'delete')
+    if all(callable(getattr(value, m, None)) for m in methods):
+        return value
+    raise ValueError(
+        'Setting should be an object with get, set and delete methods'
+        ' or None: %s' % name
+    )
+
+
+def _validate_breaker_none(name, value):
+    if value in none_variants:
+        return None
+    methods = ('allow', 'record')
+    if all(callable(getattr(value, m, None)) for m in methods):
+        return value
+    raise ValueError(
+        'Setting should be an object with allow and record methods'
+        ' or None: %s' % name
+    )
+
+
+def _validate_engine_none(name, value):
+    if value in none_variants:
+        return None
+    if isinstance(value, Engine):
+        return value
+    raise ValueError(
+        'Setting should be an SQLAlchemy engine or None: %s' % name
+    )
+
+
 def _validate_python_id(name, value):
     try:
         assert isinstance(value, str) and len(value) != 0
@@ -0,0 +1,475 @@
+import pickle
+from collections.abc import MutableMapping
+
+from sqlalchemy import (
+    LargeBinary,
+    PickleType,
+    and_,
+    bindparam,
+    exists,
+    inspect,
+    null,
+    or_,
+    select,
+    type_coerce,
+)
+from sqlalchemy.ext import baked
+from sqlalchemy.ext.hybrid import HYBRID_PROPERTY
+from sqlalchemy.orm import defer
+
+from .model import ConfigAbsoluteMixin
+
+
+_statements = {}
+
+
+def get_statements(model_class):
+    """ Return :class:`SessionStatements` shared by all users of the model
+    class, so that statements are compiled once per process. """
+    statements = _statements.get(model_class)
+    if statements is None:
+        statements = SessionStatements(model_class)
+        _statements[model_class] = statements
+    return statements
+
+
+def expired_clause(model_class, idle, absolute_timeout, now):
+    """ Return clause matching sessions expired before ``now``, or None if
+    no timeout is enabled. Non-configurable absolute timeout is applied to
+    the created column, so that the clause doesn't depend on any state of
+    the model class. """
+    filter_parts = []
+    if idle:
+        filter_parts.append(model_class.idle_expire < now)
+    if absolute_timeout:
+        if issubclass(model_class, ConfigAbsoluteMixin):
+            filter_parts.append(model_class.absolute_expire < now)
+        else:
+            filter_parts.append(model_class.created + absolute_timeout < now)
+    if not filter_parts:
+        return None
+    return or_(*filter_parts)
+
+
+class SessionRecord():
+    """ Lightweight non-ORM counterpart of a session model instance.
+    Concrete record classes are generated per model class by
+    :class:`SessionStatements`.
+
+    Keeps track of changed attributes, so that only changed columns are
+    written, similar to the ORM unit of work. Mutable values changed in
+    place have to be marked explicitly using :meth:`mark_changed`.
+    """
+    __slots__ = ('_persistent', '_changed')
+    _keys = ()
+    _model_class = None
+
+    def __init__(self, **values):
+        object.__setattr__(self, '_persistent', False)
+        object.__setattr__(self, '_changed', set())
+        for key in self._keys:
+            setattr(self, key, values.pop(key, None))
+        # Anything left over is a hybrid or another plain attribute.
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        self._changed.add(name)
+
+    def mark_changed(self, name):
+        self._changed.add(name)
+
+    def _mark_persistent(self, persistent=True):
+        object.__setattr__(self, '_persistent', persistent)
+        self._changed.clear()
+
+    def __getattr__(self, name):
+        # Only called for attributes missing on the record, i.e. for class
+        # level attributes of the model.
+        return getattr(self._model_class, name)
+
+
+_UNLOADED = object()
+
+
+class SessionRow():
+    """ Read-only session row returned by bulk reads. Columns are available
+    as attributes named as attributes of the model, and ``data`` is decoded
+    on first access only. """
+    __slots__ = ('_row', '_load_data', '_data')
+
+    def __init__(self, row, load_data):
+        self._row = row
+        self._load_data = load_data
+        self._data = _UNLOADED
+
+    def __getattr__(self, name):
+        try:
+            return self._row[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @property
+    def data(self):
+        if self._data is _UNLOADED:
+            self._data = self._load_data(self._row)
+        return self._data
+
+
+class SessionStatements():
+    """ Prebuilt Core statements for the session table of a model class.
+
+    Statements are built once per model class and are executed with a
+    shared compiled cache, so each of them is compiled only once per
+    dialect. ORM loads use a baked query for the same purpose.
+    """
+    pk_param = '_pk'
+    version_param = '_version'
+
+    def __init__(self, model_class):
+        mapper = inspect(model_class)
+        pk = mapper.primary_key[0]
+        props = mapper.column_attrs
+        self.model_class = model_class
+        self.table = mapper.local_table
+        # Attribute keys and column keys may differ for customized columns.
+        self.keys = tuple(prop.key for prop in props)
+        self.column_keys = tuple(prop.columns[0].key for prop in props)
+        self.pk_key = mapper.get_property_by_column(pk).key
+        self.pk_column_key = pk.key
+        self.compiled_cache = {}
+
+        pk_clause = pk == bindparam(self.pk_param)
+        self.load = select([prop.columns[0] for prop in props]) \
+            .where(pk_clause)
+        # Flash messages stored outside of the row aren't loaded.
+        self.load_without_flash = select([
+            null() if prop.key == 'flash' else prop.columns[0]
+            for prop in props
+        ]).where(pk_clause)
+        self.insert = self.table.insert()
+        self.update = self.table.update().where(pk_clause)
+        self.delete = self.table.delete().where(pk_clause)
+        self.record_class = self._record_class(mapper)
+
+        # Bulk reads select pickled data as is, it's unpickled by SessionRow
+        # on access.
+        columns = []
+        self.data_loads = None
+        for prop in props:
+            column = prop.columns[0]
+            if prop.key == 'data' and isinstance(column.type, PickleType):
+                self.data_loads = column.type.pickler.loads
+                column = type_coerce(column, LargeBinary)
+            columns.append(column.label(prop.key))
+        self.scan = select(columns)
+
+        version = mapper.version_id_col
+        self.version_key = None
+        self.versioned_update = None
+        if version is not None:
+            self.version_key = mapper.get_property_by_column(version).key
+            self.version_column_key = version.key
+            self.versioned_update = self.table.update().where(and_(
+                pk_clause,
+                version == bindparam(self.version_param),
+            ))
+
+        self.data_statements = None
+        data_table = getattr(model_class, 'data_table', None)
+        if data_table is not None:
+            self.data_statements = DataStatements(data_table, pk)
+
+        self.user_statements = None
+        if 'userid' in self.keys:
+            self.user_statements = UserStatements(
+                self.table,
+                pk,
+                mapper.get_property('userid').columns[0],
+                data_table,
+            )
+
+        self.bakery = baked.bakery()
+        self.baked_load = self.bakery(
+            lambda dbsession: dbsession.query(model_class),
+            model_class,
+        )
+        self.baked_load_without_flash = self.baked_load.with_criteria(
+            lambda query: query.options(defer('flash'))
+        )
+        self._expired_deletes = {}
+
+    def _record_class(self, mapper):
+        attrs = {
+            '__slots__': self.keys,
+            '_keys': self.keys,
+            '_model_class': self.model_class,
+        }
+        for key, desc in mapper.all_orm_descriptors.items():
+            if desc.extension_type is HYBRID_PROPERTY:
+                attrs[key] = desc
+        name = self.model_class.__name__ + 'Record'
+        return type(name, (SessionRecord,), attrs)
+
+    def connection(self, dbsession, cached=True):
+        """ Return the dbsession connection, using the compiled cache
+        unless disabled. """
+        conn = dbsession.connection()
+        if cached:
+            conn = conn.execution_options(compiled_cache=self.compiled_cache)
+        return conn
+
+    def load_instance(self, dbsession, id, flash=True):
+        """ Load ORM instance by primary key using the baked query. The
+        flash column is deferred unless ``flash`` is true. """
+        if flash:
+            return self.baked_load(dbsession).get(id)
+        return self.baked_load_without_flash(dbsession).get(id)
+
+    def expired_delete(self, idle, absolute_timeout):
+        """ Return statement deleting sessions expired before the ``now``
+        bound parameter, or None if no timeout is enabled. """
+        key = (bool(idle), absolute_timeout)
+        if key in self._expired_deletes:
+            return self._expired_deletes[key]
+        # Note: non-config absolute timeout value is embedded in the
+        # clause, hence it is a part of the key.
+        clause = expired_clause(
+            self.model_class,
+            idle,
+            absolute_timeout,
+            bindparam('now'),
+        )
+        stmt = None
+        if clause is not None:
+            stmt = self.table.delete().where(clause)
+        self._expired_deletes[key] = stmt
+        return stmt
+
+    def new_record(self, **values):
+        return self.record_class(**values)
+
+    def load_record(self, conn, id, flash=True):
+        stmt = self.load if flash else self.load_without_flash
+        row = conn.execute(stmt, {self.pk_param: id}).first()
+        if row is None:
+            return None
+        record = self.record_class(**dict(zip(self.keys, row)))
+        record._mark_persistent()
+        return record
+
+    def insert_record(self, conn, record):
+        conn.execute(self.insert, {
+            column_key: getattr(record, key)
+            for key, column_key in zip(self.keys, self.column_keys)
+        })
+        record._mark_persistent()
+
+    def update_record(self, conn, record):
+        """ Write changed columns of the record, if any. """
+        changed = record._changed
+        values = {
+            column_key: getattr(record, key)
+            for key, column_key in zip(self.keys, self.column_keys)
+            if key in changed
+        }
+        if values:
+            values[self.pk_param] = getattr(record, self.pk_key)
+            conn.execute(self.update, values)
+        record._mark_persistent()
+
+    def update_versioned(self, conn, id, version, values):
+        """ Update the row by attribute values if the row version matches,
+        incrementing the version. Return True on success. """
+        params = {
+            column_key: values[key]
+            for key, column_key in zip(self.keys, self.column_keys)
+            if key in values
+        }
+        params[self.version_column_key] = version + 1
+        params[self.pk_param] = id
+        params[self.version_param] = version
+        result = conn.execute(self.versioned_update, params)
+        return result.rowcount == 1
+
+    def delete_record(self, conn, record):
+        id = getattr(record, self.pk_key)
+        conn.execute(self.delete, {self.pk_param: id})
+        record._mark_persistent(False)
+
+
+class KeyValueData(MutableMapping):
+    """ Session data dict stored as a row per key.
+
+    Rows are loaded on first access using the ``load`` callable, values are
+    unpickled on first access to their keys. Once :meth:`changed` has been
+    called, accessed values are compared to their stored pickles, so that
+    only added, changed and deleted keys are written.
+    """
+    def __init__(self, load=None):
+        self._load = load
+        self._raw = None if load is not None else {}
+        self._values = {}
+        self._deleted = set()
+        self.dirty = False
+
+    def _rows(self):
+        if self._raw is None:
+            self._raw = dict(self._load())
+        return self._raw
+
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        raw = self._rows()
+        if key in self._deleted or key not in raw:
+            raise KeyError(key)
+        value = self._values[key] = pickle.loads(raw[key])
+        return value
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, str):
+            raise TypeError('Session data keys must be strings.')
+        self._values[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._values.pop(key, None)
+        if key in self._rows():
+            self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._values:
+            return True
+        return key in self._rows() and key not in self._deleted
+
+    def __iter__(self):
+        raw = self._rows()
+        for key in raw:
+            if key not in self._deleted:
+                yield key
+        for key in list(self._values):
+            if key not in raw:
+                yield key
+
+    def __len__(self):
+        raw = self._rows()
+        added = sum(1 for key in self._values if key not in raw)
+        return len(raw) - len(self._deleted) + added
+
+    def changed(self):
+        """ Mark the data as possibly changed, including changes made in
+        place. """
+        self.dirty = True
+
+    def changes(self):
+        """ Return pickles of added and changed keys and a set of deleted
+        keys. """
+        raw = self._rows()
+        added = {}
+        updated = {}
+        for key, value in self._values.items():
+            dumped = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if key not in raw:
+                added[key] = dumped
+            elif raw[key] != dumped:
+                updated[key] = dumped
+        return added, updated, set(self._deleted)
+
+    def _mark_saved(self, added, updated, deleted):
+        self._raw.update(added)
+        self._raw.update(updated)
+        for key in deleted:
+            del self._raw[key]
+        self._deleted.clear()
+        self.dirty = False
+
+
+class DataStatements():
+    """ Prebuilt Core statements for the data table of
+    :class:`.KeyValueDataMixin` models. """
+    session_param = '_session_id'
+    key_param = '_key'
+
+    def __init__(self, table, session_pk):
+        c = table.c
+        self.table = table
+        session_clause = c.session_id == bindparam(self.session_param)
+        key_clause = and_(session_clause, c.key == bindparam(self.key_param))
+        self.load = select([c.key, c.value]).where(session_clause)
+        self.insert = table.insert()
+        self.update = table.update().where(key_clause)
+        self.delete = table.delete().where(key_clause)
+        self.delete_all = table.delete().where(session_clause)
+        self.delete_orphans = table.delete().where(
+            ~exists().where(session_pk == c.session_id)
+        )
+
+    def load_rows(self, conn, session_id):
+        """ Return (key, pickled value) rows of the session. """
+        result = conn.execute(self.load, {self.session_param: session_id})
+        return result.fetchall()
+
+    def save_data(self, conn, session_id, data):
+        """ Write changed keys of :class:`KeyValueData`. """
+        added, updated, deleted = data.changes()
+        if added:
+            conn.execute(self.insert, [
+                {'session_id': session_id, 'key': key, 'value': value}
+                for key, value in added.items()
+            ])
+        if updated:
+            conn.execute(self.update, [
+                {self.session_param: session_id, self.key_param: key,
+                 'value': value}
+                for key, value in updated.items()
+            ])
+        if deleted:
+            conn.execute(self.delete, [
+                {self.session_param: session_id, self.key_param: key}
+                for key in deleted
+            ])
+        data._mark_saved(added, updated, deleted)
+
+    def delete_rows(self, conn, session_id):
+        conn.execute(self.delete_all, {self.session_param: session_id})
+
+
+class UserStatements():
+    """ Prebuilt Core statements operating on all sessions of a user, for
+    models using :class:`.UseridMixin`. """
+    userid_param = '_userid'
+    keep_param = '_keep'
+
+    def __init__(self, table, pk, userid, data_table=None):
+        by_user = userid == bindparam(self.userid_param)
+        by_user_except = and_(by_user, pk != bindparam(self.keep_param))
+        self.delete = table.delete().where(by_user)
+        self.delete_except = table.delete().where(by_user_except)
+        self.data_delete = None
+        self.data_delete_except = None
+        if data_table is not None:
+            # Databases not enforcing foreign keys don't cascade deletes.
+            session_id = data_table.c.session_id
+            self.data_delete = data_table.delete().where(
+                session_id.in_(select([pk]).where(by_user))
+            )
+            self.data_delete_except = data_table.delete().where(
+                session_id.in_(select([pk]).where(by_user_except))
+            )
+
+    def delete_sessions(self, conn, userid, keep=None):
+        """ Delete sessions of the user except the ``keep`` session id, and
+        return the number of deleted sessions. """
+        params = {self.userid_param: userid}
+        if keep is None:
+            data_delete, delete = self.data_delete, self.delete
+        else:
+            params[self.keep_param] = keep
+            data_delete, delete = self.data_delete_except, self.delete_except
+        if data_delete is not None:
+            conn.execute(data_delete, params)
+        return conn.execute(delete, params).rowcount
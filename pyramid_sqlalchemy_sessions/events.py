@@ -20,3 +20,19 @@ class RenewalViolationEvent(SessionEvent):
     be a sign of a stolen session cookie or abnormal browser behavior such
     as using old cookies restored from a backup.
     """
+
+
+class BreakerOpenedEvent(SessionEvent):
+    """
+    Pyramid :term:`event`.
+    Fired when the circuit breaker opens after failing or slow session DB
+    operations. ``exception`` is the database error of the last operation,
+    if any.
+    """
+
+
+class BreakerClosedEvent(SessionEvent):
+    """
+    Pyramid :term:`event`.
+    Fired when the circuit breaker closes after a successful trial request.
+    """
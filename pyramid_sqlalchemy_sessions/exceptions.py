@@ -1,3 +1,6 @@
+from transaction.interfaces import TransientError
+
+
 class ConfigurationError(Exception):
     """ Raised when the session factory has been incorrectly configured. """
 
@@ -39,3 +42,13 @@ class CookieCryptoError(Exception):
     the application. You can subscribe to :class:`.CookieCryptoErrorEvent`
     event if you want to run additional procedures when it happens.
     """
+
+
+class SessionConflictError(TransientError):
+    """
+    Raised when a versioned session could not be saved because concurrent
+    requests kept changing the same session row, even after merging.
+
+    The exception is a transient error, so the request could be retried by
+    the transaction manager (see ``tm.attempts`` setting of ``pyramid_tm``).
+    """
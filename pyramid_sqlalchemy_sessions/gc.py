@@ -1,18 +1,37 @@
 import argparse
 import logging
+import os
 import sys
+from time import perf_counter
 
+import plaster
+import transaction
 from pyramid.paster import (
     bootstrap,
     setup_logging
 )
 from pyramid.util import DottedNameResolver
-from sqlalchemy.sql import or_
+from sqlalchemy import engine_from_config
+from sqlalchemy.orm import sessionmaker
+from zope.sqlalchemy import (
+    mark_changed,
+    register,
+)
 
+from .bulk import invalidate_user_sessions
 from .config import (
     factory_args_from_settings,
     _process_factory_args,
 )
+from .core import (
+    expired_clause,
+    get_statements,
+)
+from .metrics import SessionMetrics
+from .partitions import (
+    expired_delete,
+    get_partitions,
+)
 from .util import int_now
 
 
@@ -25,10 +44,42 @@ class GCCommand():
     description = "Clean session table by removing expired session rows."
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument('config_uri', nargs='?', default=None)
+    parser.add_argument(
+        '--invalidate-userid',
+        type=int,
+        action='append',
+        metavar='USERID',
+        help="Instead of cleaning, invalidate all sessions of the user."
+             " May be repeated.",
+    )
+    parser.add_argument(
+        '--light',
+        action='store_true',
+        help="Don't bootstrap the application: read the settings from the"
+             " config file and connect using a bare engine.",
+    )
+    parser.add_argument(
+        '--engine-prefix',
+        default='sqlalchemy.',
+        help="Prefix of the engine settings used with --light"
+             " (default: %(default)s).",
+    )
+    parser.add_argument(
+        '--prefix',
+        default=None,
+        help="Prefix of the session settings, e.g. of a tenant"
+             " (default: session.).",
+    )
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help="Write GC metrics in Prometheus text format to the file, e.g. "
+             "for the textfile collector of node_exporter.",
+    )
 
     def __init__(self, argv, prefix='session.'):
         self.args = self.parser.parse_args(argv[1:])
-        self.prefix = prefix
+        self.prefix = self.args.prefix or prefix
 
     @staticmethod
     def parse_config(config_uri, prefix):
@@ -45,16 +96,77 @@ class GCCommand():
                 'tm': env['request'].tm
             }
 
+    @staticmethod
+    def parse_light_config(config_uri, prefix, engine_prefix='sqlalchemy.'):
+        """ Read the settings without loading the application, and create
+        a dbsession bound to a new engine. """
+        # Read the app section directly: loading it through PasteDeploy
+        # would import the application package.
+        name = plaster.parse_uri(config_uri).fragment or 'main'
+        app_settings = plaster.get_settings(config_uri, 'app:' + name)
+        settings = _process_factory_args(factory_args_from_settings(
+            app_settings,
+            DottedNameResolver().maybe_resolve,
+            prefix,
+        ))
+        engine = engine_from_config(app_settings, engine_prefix)
+        tm = transaction.TransactionManager(explicit=True)
+        dbsession = sessionmaker(bind=engine)()
+        register(dbsession, transaction_manager=tm)
+        return {
+            'dbsession': dbsession,
+            'settings': settings,
+            'tm': tm,
+        }
+
     def run(self):
         if not self.args.config_uri:
             print("Error: the following arguments are required: config_uri")
             return 2
         config_uri = self.args.config_uri
         setup_logging(config_uri)
-        config = self.parse_config(config_uri, self.prefix)
+        if self.args.light:
+            config = self.parse_light_config(
+                config_uri,
+                self.prefix,
+                self.args.engine_prefix,
+            )
+        else:
+            config = self.parse_config(config_uri, self.prefix)
+        if self.args.invalidate_userid:
+            self.invalidate_users(self.args.invalidate_userid, **config)
+            return 0
+        metrics = None
+        if self.args.metrics_file:
+            metrics = SessionMetrics()
+            config['settings'] = dict(config['settings'], metrics=metrics)
         Cleaner(**config).clean()
+        if metrics is not None:
+            self.write_metrics(self.args.metrics_file, metrics)
         return 0
 
+    @staticmethod
+    def invalidate_users(userids, dbsession, settings, tm):
+        model_class = settings['model_class']
+        with tm:
+            for userid in userids:
+                deleted = invalidate_user_sessions(
+                    dbsession,
+                    model_class,
+                    userid,
+                    tm=tm,
+                )
+                print("Invalidated %d sessions of user %d" % (deleted, userid))
+
+    @staticmethod
+    def write_metrics(path, metrics):
+        # Replace the file atomically, so that collectors never read
+        # a partially written file.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(metrics.render())
+        os.replace(tmp_path, path)
+
 
 class Cleaner():
     logger = logging.getLogger(__name__)
@@ -65,9 +177,13 @@ class Cleaner():
         self.tm = tm
 
     def clean(self):
+        start = perf_counter()
         with self.tm as txn:
             txn.addAfterCommitHook(self.log_result)
-            self.delete_query(self.dbsession, self.settings)
+            deleted = self.delete_expired(self.dbsession, self.settings)
+        metrics = self.settings.get('metrics')
+        if metrics is not None and deleted is not None:
+            metrics(None, 'gc', perf_counter() - start, deleted)
 
     def log_result(self, status):
         if status:
@@ -77,16 +193,92 @@ class Cleaner():
                 'Could not clean session table: transaction commit failed.'
             )
 
-    @staticmethod
-    def delete_query(dbsession, settings):
-        cls = settings['model_class']
-        filter_parts = []
-        if settings['idle_timeout']:
-            filter_parts.append(cls.idle_expire < int_now())
-        if settings['absolute_timeout']:
-            filter_parts.append(cls.absolute_expire < int_now())
-        if filter_parts:
-            dbsession.query(cls).filter(or_(*filter_parts)).delete()
-            return True
+    @classmethod
+    def delete_query(cls, dbsession, settings):
+        """ Delete expired sessions. Return False if no timeout is
+        enabled. """
+        return cls.delete_expired(dbsession, settings) is not None
+
+    @classmethod
+    def delete_expired(cls, dbsession, settings):
+        """ Delete expired sessions and return the number of deleted rows,
+        or None if no timeout is enabled. """
+        model_class = settings['model_class']
+        statements = get_statements(model_class)
+        deleted = 0
+        if settings.get('partition_key') is not None:
+            # Drop expired partitions first, so that row deletes don't
+            # scan them.
+            deleted = cls.clean_partitions(dbsession, settings, statements)
+        if settings['statement_cache']:
+            stmt = statements.expired_delete(
+                settings['idle_timeout'],
+                settings['absolute_timeout'],
+            )
+            if stmt is None:
+                return None
+            conn = statements.connection(dbsession)
+            result = conn.execute(stmt, {'now': int_now()})
+            mark_changed(dbsession)
+            cls.delete_orphan_data(dbsession, statements)
+            return result.rowcount + deleted
+        clause = expired_clause(
+            model_class,
+            settings['idle_timeout'],
+            settings['absolute_timeout'],
+            int_now(),
+        )
+        if clause is not None:
+            deleted += dbsession.query(model_class) \
+                .filter(clause).delete()
+            cls.delete_orphan_data(dbsession, statements)
+            return deleted
         else:
-            return False
+            return None
+
+    @classmethod
+    def clean_partitions(cls, dbsession, settings, statements):
+        """ Drop partitions holding only expired sessions and create missing
+        partitions for new sessions. Return the number of rows deleted from
+        partitions not covered by deletes from the session table. """
+        conn = statements.connection(dbsession, cached=False)
+        partitions = get_partitions(
+            conn,
+            statements.table,
+            settings['partition_key'],
+            settings['partition_interval'],
+        )
+        scheme = partitions.scheme
+        now = int_now()
+        absolute_timeout = settings['absolute_timeout']
+        remaining = partitions.partitions(conn)
+        for start, name in sorted(remaining.items()):
+            if scheme.expired(start, now, absolute_timeout):
+                partitions.drop(conn, name)
+                del remaining[start]
+                cls.logger.info('Dropped expired session partition %s.', name)
+        for start in scheme.needed(now, absolute_timeout):
+            if start not in remaining:
+                partitions.create(conn, start)
+                remaining[start] = scheme.name(start)
+        mark_changed(dbsession)
+        deleted = 0
+        for table in partitions.row_tables(remaining.values()):
+            stmt = expired_delete(
+                table,
+                settings['idle_timeout'],
+                absolute_timeout,
+            )
+            deleted += conn.execute(stmt, {'now': now}).rowcount
+        return deleted
+
+    @staticmethod
+    def delete_orphan_data(dbsession, statements):
+        """ Delete data rows of removed sessions, when the model is using
+        KeyValueDataMixin and the database doesn't cascade deletes. """
+        data_statements = statements.data_statements
+        if data_statements is None:
+            return
+        conn = statements.connection(dbsession)
+        conn.execute(data_statements.delete_orphans)
+        mark_changed(dbsession)
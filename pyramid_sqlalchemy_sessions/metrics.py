@@ -0,0 +1,273 @@
+import threading
+
+from .events import (
+    CookieCryptoErrorEvent,
+    InvalidCookieErrorEvent,
+    RenewalViolationEvent,
+)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (
+    .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10,
+)
+
+
+class _Metric():
+    """ Base class of metrics sharded per thread: every thread updates its
+    own shard, so updates don't need locks. Shards are merged on reads. """
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._shards = []
+        self._local = threading.local()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # list.append is atomic, so new threads don't need a lock either.
+            self._shards.append(shard)
+            return shard
+
+    def _format_labels(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join(
+            '%s="%s"' % (name, _escape(str(value))) for name, value in pairs
+        )
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.help),
+            '# TYPE %s %s' % (self.name, self.type),
+        ]
+        for name, labels, value in self._samples():
+            lines.append('%s%s %s' % (name, labels, _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """ Monotonic counter. """
+    type = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self):
+        """ Return dict of totals by label values. """
+        totals = {}
+        for shard in list(self._shards):
+            for labels, value in shard.copy().items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def _samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, self._format_labels(labels), value
+
+
+class Gauge(_Metric):
+    """ Gauge holding the last set value, per label values. """
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        # A single dict: item assignment is atomic and ordering between
+        # threads doesn't matter for the last value.
+        self._values = {}
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def values(self):
+        return self._values.copy()
+
+    def _samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name, self._format_labels(labels), value
+
+
+class Histogram(_Metric):
+    """ Histogram of observed values with cumulative buckets. """
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # Bucket counts (the last one is +Inf), sum.
+            state = shard[labels] = [[0] * (len(self.buckets) + 1), 0]
+        counts = state[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        state[1] += value
+
+    def values(self):
+        """ Return dict of (bucket counts, sum) by label values. Bucket
+        counts are not cumulative. """
+        merged = {}
+        for shard in list(self._shards):
+            for labels, (counts, total) in shard.copy().items():
+                counts = list(counts)
+                if labels in merged:
+                    m_counts, m_total = merged[labels]
+                    counts = [a + b for a, b in zip(m_counts, counts)]
+                    total += m_total
+                merged[labels] = (counts, total)
+        return merged
+
+    def _samples(self):
+        bounds = [_format_value(b) for b in self.buckets] + ['+Inf']
+        for labels, (counts, total) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (
+                    self.name + '_bucket',
+                    self._format_labels(labels, [('le', bound)]),
+                    cumulative,
+                )
+            label_str = self._format_labels(labels)
+            yield self.name + '_sum', label_str, total
+            yield self.name + '_count', label_str, cumulative
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class SessionMetrics():
+    """
+    Per-process aggregation of session activity, exposed in Prometheus
+    text exposition format.
+
+    Use the instance as the ``metrics`` setting, and call :meth:`subscribe`
+    to also count cookie errors and renewal violations reported by
+    :ref:`events`. Serve :meth:`render` output with :data:`CONTENT_TYPE`
+    from a view of your application.
+    """
+    def __init__(self, namespace='pyramid_session', buckets=DEFAULT_BUCKETS):
+        def name(suffix):
+            return namespace + '_' + suffix
+        self.created = Counter(name('created_total'), 'Sessions created.')
+        self.saved = Counter(
+            name('saved_total'),
+            'Writes of existing sessions.',
+        )
+        self.invalidated = Counter(
+            name('invalidated_total'),
+            'Sessions invalidated.',
+        )
+        self.extended = Counter(
+            name('extended_total'),
+            'Session writes forced by the idle timeout extension.',
+        )
+        self.renewals = Counter(
+            name('renewals_total'),
+            'Renewal procedure steps.',
+            ('outcome',),
+        )
+        self.loads = Counter(
+            name('loads_total'),
+            'Session loads by cookie.',
+            ('outcome',),
+        )
+        self.cookie_errors = Counter(
+            name('cookie_errors_total'),
+            'Rejected session cookies.',
+            ('reason',),
+        )
+        self.renewal_violations = Counter(
+            name('renewal_violations_total'),
+            'Renewal violations, i.e. possible session cookie thefts.',
+        )
+        self.phases = Histogram(
+            name('phase_seconds'),
+            'Duration of session lifecycle phases.',
+            ('phase',),
+            buckets,
+        )
+        self.gc_runs = Counter(name('gc_runs_total'), 'GC runs.')
+        self.gc_deleted = Counter(
+            name('gc_deleted_rows_total'),
+            'Session rows deleted by GC.',
+        )
+        self.gc_last_deleted = Gauge(
+            name('gc_last_deleted_rows'),
+            'Session rows deleted by the last GC run.',
+        )
+        self.metrics = (
+            self.created, self.saved, self.invalidated, self.extended,
+            self.renewals, self.loads, self.cookie_errors,
+            self.renewal_violations, self.phases, self.gc_runs,
+            self.gc_deleted, self.gc_last_deleted,
+        )
+
+    def __call__(self, request, name, duration, outcome):
+        if duration is not None:
+            self.phases.observe(duration, (name,))
+        if name == 'before_commit':
+            if outcome == 'created':
+                self.created.inc()
+            elif outcome == 'saved':
+                self.saved.inc()
+        elif name == 'load':
+            self.loads.inc(labels=(outcome,))
+        elif name == 'extension':
+            self.extended.inc()
+        elif name == 'renewal':
+            self.renewals.inc(labels=(outcome,))
+        elif name == 'invalidate':
+            self.invalidated.inc()
+        elif name == 'gc':
+            self.gc_runs.inc()
+            self.gc_deleted.inc(outcome)
+            self.gc_last_deleted.set(outcome)
+
+    def subscribe(self, config):
+        """ Subscribe to session events using Pyramid configurator. """
+        config.add_subscriber(self.on_cookie_error, InvalidCookieErrorEvent)
+        config.add_subscriber(self.on_cookie_error, CookieCryptoErrorEvent)
+        config.add_subscriber(
+            self.on_renewal_violation,
+            RenewalViolationEvent,
+        )
+
+    def on_cookie_error(self, event):
+        if isinstance(event, CookieCryptoErrorEvent):
+            reason = 'crypto'
+        else:
+            reason = 'invalid'
+        self.cookie_errors.inc(labels=(reason,))
+
+    def on_renewal_violation(self, event):
+        self.renewal_violations.inc()
+
+    def render(self):
+        """ Return metrics in Prometheus text exposition format. """
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
@@ -4,13 +4,14 @@ import uuid
 from sqlalchemy import (
     Boolean,
     Column,
+    ForeignKey,
     Integer,
     LargeBinary,
     PickleType,
     SmallInteger,
+    Table,
     Unicode,
 )
-from sqlalchemy.dialects.postgresql import UUID as pgUUID
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
@@ -26,6 +27,8 @@ class UUID(TypeDecorator):
 
     def load_dialect_impl(self, dialect):
         if dialect.name == 'postgresql':
+            # The dialect is loaded by now, don't import it for others.
+            from sqlalchemy.dialects.postgresql import UUID as pgUUID
             return dialect.type_descriptor(pgUUID())
         else:
             return dialect.type_descriptor(LargeBinary(16))
@@ -86,6 +89,13 @@ class UseridMixin:
     userid = Column(Integer)
 
 
+class IndexedUseridMixin(UseridMixin):
+    """ Mixin that enables :ref:`userid-feature` feature with an indexed
+    userid column, for :ref:`bulk operations <bulk-feature>` on sessions of
+    a user. """
+    userid = Column(Integer, index=True)
+
+
 CSRF_TOKEN_SIZE = 20
 
 
@@ -102,6 +112,19 @@ class RenewalMixin:
     renewal_next = Column(UUID)
 
 
+class HMACRenewalMixin(RenewalMixin):
+    """
+    Mixin that enables :ref:`renewal-timeout-feature` feature with renewal
+    IDs derived from the session ID and a renewal epoch, see
+    :ref:`hmac-renewal`. Only the epoch is stored, so a renewal costs a
+    single write.
+    """
+    renewal_id = None
+    renewal_tried = None
+    renewal_next = None
+    renewal_epoch = Column(Integer, nullable=False)
+
+
 class IdleMixin:
     """ Mixin that enables :ref:`idle-timeout-feature` feature. """
     idle_expire = Column(Integer)
@@ -111,11 +134,16 @@ class AbsoluteMixin:
     """ Mixin that enables :ref:`absolute-timeout-feature` feature. """
     # Since we always provide "created" timestamp to satisfy the ISession
     # requirement, and the timeout is same for all sessions, it's enough to
-    # calculate absolute_expire using created column.
+    # calculate absolute_expire using created column. The library doesn't
+    # use the hybrid, as the timeout is a setting of the session factory,
+    # and factories don't set it here anymore: set absolute_timeout on the
+    # model class to use the hybrid in own queries, see multiple-tenants in
+    # the docs.
+    absolute_timeout = None
+
     @hybrid_property
     def absolute_expire(self):
         if self.absolute_timeout is not None:
-            # Note: self.absolute_timeout should be monkeypatched.
             return self.created + self.absolute_timeout
 
     @absolute_expire.setter
@@ -126,6 +154,72 @@ class AbsoluteMixin:
         )
 
 
+class VersionMixin:
+    """ Mixin that enables :ref:`version-feature` feature. """
+    version = Column(Integer, nullable=False)
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {'version_id_col': cls.version}
+
+
+DATA_KEY_SIZE = 255
+
+
+class KeyValueDataMixin:
+    """
+    Mixin that enables :ref:`keyvalue-data-feature` feature. Session data is
+    stored in a separate table (named after the session table, with
+    ``_data`` suffix) containing a row per key of the session dict.
+    """
+    # Replaces the pickled data column of BaseMixin.
+    data = None
+
+    @declared_attr
+    def data_table(cls):
+        return Table(
+            cls.__tablename__ + '_data',
+            cls.metadata,
+            Column(
+                'session_id',
+                UUID,
+                ForeignKey(cls.__tablename__ + '.id', ondelete='CASCADE'),
+                primary_key=True,
+            ),
+            Column('key', Unicode(DATA_KEY_SIZE), primary_key=True),
+            Column('value', LargeBinary, nullable=False),
+        )
+
+
+class PartitionedMixin:
+    """
+    Mixin for a session table partitioned by ranges of ``created`` or
+    ``absolute_expire`` column on PostgreSQL, see :ref:`partitions`. Put it
+    first in the bases and set ``__partition_key__`` to the column name.
+
+    PostgreSQL requires the partition key to be a part of unique
+    constraints, so the ``id`` column is only indexed and uniqueness of
+    session IDs is left to their randomness. It's not compatible with
+    :class:`.KeyValueDataMixin`, as its foreign key needs a unique ``id``.
+    """
+    __partition_key__ = 'created'
+
+    id = Column(UUID, nullable=False, index=True)
+
+    @declared_attr
+    def __table_args__(cls):
+        return {
+            'postgresql_partition_by': 'RANGE (%s)' % cls.__partition_key__,
+        }
+
+    @declared_attr
+    def __mapper_args__(cls):
+        args = {'primary_key': [cls.id]}
+        if issubclass(cls, VersionMixin):
+            args['version_id_col'] = cls.version
+        return args
+
+
 class ConfigCookieMixin:
     """ Mixin that enables :ref:`config-cookie-feature` feature. """
     cookie_max_age = Column(Integer)
@@ -0,0 +1,185 @@
+import re
+
+from sqlalchemy import (
+    MetaData,
+    Table,
+    bindparam,
+    text,
+)
+from sqlalchemy.sql import or_
+
+from .exceptions import ConfigurationError
+
+
+PARTITION_KEYS = ('created', 'absolute_expire')
+
+
+class PartitionScheme():
+    """ Ranges of session table partitions: partition ``<table>_p<start>``
+    holds sessions with the key column in ``[start, start + interval)``. """
+
+    def __init__(self, table, key, interval):
+        self.table = table
+        self.key = key
+        self.interval = interval
+        self._name_re = re.compile(re.escape(table.name) + r'_p(\d+)$')
+
+    def start(self, value):
+        return value - value % self.interval
+
+    def name(self, start):
+        return '%s_p%d' % (self.table.name, start)
+
+    def parse(self, name):
+        """ Return start of the partition range, or None if the table is not
+        a partition of the scheme. """
+        match = self._name_re.match(name)
+        if match is None:
+            return None
+        return int(match.group(1))
+
+    def expired(self, start, now, absolute_timeout):
+        """ Return True if all sessions of the partition have expired. """
+        end = start + self.interval
+        if self.key == 'created':
+            end += absolute_timeout
+        return end <= now
+
+    def needed(self, now, absolute_timeout):
+        """ Return starts of partitions receiving sessions created until the
+        end of the next interval. """
+        end = now + self.interval
+        if self.key == 'absolute_expire':
+            end += absolute_timeout
+        return range(self.start(now), end, self.interval)
+
+
+class _Partitions():
+    """ Base class of partition management of a dialect. """
+
+    def __init__(self, scheme):
+        self.scheme = scheme
+
+    def partitions(self, conn):
+        """ Return dict of partition names by their range starts. """
+        partitions = {}
+        for name in self._names(conn):
+            start = self.scheme.parse(name)
+            if start is not None:
+                partitions[start] = name
+        return partitions
+
+    def _names(self, conn):
+        raise NotImplementedError
+
+    def create(self, conn, start):
+        raise NotImplementedError
+
+    def drop(self, conn, name):
+        raise NotImplementedError
+
+    def row_tables(self, names):
+        """ Return partition tables not covered by deletes from the parent
+        table. """
+        return []
+
+    def _format(self, conn, name):
+        table = Table(name, MetaData(), schema=self.scheme.table.schema)
+        return conn.dialect.identifier_preparer.format_table(table)
+
+
+class PostgresqlPartitions(_Partitions):
+    """ Native declarative partitioning of PostgreSQL 10+. """
+
+    def _names(self, conn):
+        rows = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i"
+                " JOIN pg_class c ON c.oid = i.inhrelid"
+                " WHERE i.inhparent = CAST(:parent AS regclass)"
+            ),
+            parent=self._format(conn, self.scheme.table.name),
+        )
+        return [row[0] for row in rows]
+
+    def create(self, conn, start):
+        conn.execute(text(
+            'CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%d) TO (%d)' % (
+                self._format(conn, self.scheme.name(start)),
+                self._format(conn, self.scheme.table.name),
+                start,
+                start + self.scheme.interval,
+            )
+        ))
+
+    def drop(self, conn, name):
+        conn.execute(text('ALTER TABLE %s DETACH PARTITION %s' % (
+            self._format(conn, self.scheme.table.name),
+            self._format(conn, name),
+        )))
+        conn.execute(text('DROP TABLE %s' % self._format(conn, name)))
+
+
+class SQLitePartitions(_Partitions):
+    """ Stand-in emulating partitions by tables with the same columns as the
+    session table. Sessions are not routed to them, so they are only useful
+    to test GC. """
+
+    def _names(self, conn):
+        rows = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ))
+        return [row[0] for row in rows]
+
+    def table(self, name):
+        parent = self.scheme.table
+        return Table(
+            name,
+            MetaData(),
+            *[column.copy() for column in parent.columns],
+            schema=parent.schema
+        )
+
+    def create(self, conn, start):
+        self.table(self.scheme.name(start)).create(conn)
+
+    def drop(self, conn, name):
+        self.table(name).drop(conn)
+
+    def row_tables(self, names):
+        return [self.table(name) for name in names]
+
+
+PARTITIONS = {
+    'postgresql': PostgresqlPartitions,
+    'sqlite': SQLitePartitions,
+}
+
+
+def get_partitions(conn, table, key, interval):
+    """ Return partition management for the dialect of the connection. """
+    try:
+        partitions_class = PARTITIONS[conn.dialect.name]
+    except KeyError:
+        raise ConfigurationError(
+            "Partitioned session table is not supported for %s."
+            % conn.dialect.name
+        )
+    return partitions_class(PartitionScheme(table, key, interval))
+
+
+def expired_delete(table, idle, absolute_timeout):
+    """ Return statement deleting rows of a session table expired before the
+    ``now`` bound parameter, or None if no timeout is enabled. """
+    now = bindparam('now')
+    filter_parts = []
+    if idle:
+        filter_parts.append(table.c.idle_expire < now)
+    if absolute_timeout:
+        if 'absolute_expire' in table.c:
+            filter_parts.append(table.c.absolute_expire < now)
+        else:
+            filter_parts.append(table.c.created + absolute_timeout < now)
+    if not filter_parts:
+        return None
+    return table.delete().where(or_(*filter_parts))
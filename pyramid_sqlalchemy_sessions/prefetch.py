@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from pyramid.interfaces import ISessionFactory
+
+from .session import PREFETCH_KEY
+
+
+def prefetch_tween_factory(handler, registry):
+    """
+    Pyramid :term:`tween` decrypting the session cookie and loading the
+    session row in a thread pool as soon as a request arrives, so that the
+    DB roundtrip overlaps with routing, authentication and view lookup.
+    The session picks up the result when it's first accessed, or does the
+    work itself if the pool hasn't started it yet.
+
+    Only works with session factories using the ``persistence_engine``
+    setting, as the dbsession of the request can't be shared with other
+    threads. Size of the pool is read from the
+    ``session.prefetch_workers`` setting (default: 4).
+
+    Rows are loaded for every request with a session cookie, even if its
+    view never uses the session: such loads are wasted, unless the pool
+    hasn't started them by the end of the request. Prefetch loads are
+    reported to the circuit breaker by the session using them, and nothing
+    is prefetched while the breaker is open.
+
+    With :class:`.SessionFactoryRegistry`, the tenant resolver is called by
+    the tween before the request is routed, so it must not depend on the
+    matched route or on authentication. Requests it fails for aren't
+    prefetched.
+    """
+    workers = int(registry.settings.get('session.prefetch_workers', 4))
+    executor = ThreadPoolExecutor(workers)
+
+    def prefetch_tween(request):
+        factory = registry.queryUtility(ISessionFactory)
+        get_factory = getattr(factory, 'get_factory', None)
+        if get_factory is not None:
+            # Factory of the tenant. The request isn't routed yet, so the
+            # tenant resolver may fail: leave it to the session.
+            try:
+                factory = get_factory(request)
+            except Exception:
+                factory = None
+        prefetch = getattr(factory, '_prefetch', None)
+        if prefetch is not None:
+            cookie_raw = request.cookies.get(factory._cookie_name)
+            breaker = factory._circuit_breaker
+            if cookie_raw is not None and (breaker is None or
+                                           not breaker.open):
+                request.environ[PREFETCH_KEY] = (
+                    cookie_raw,
+                    executor.submit(prefetch, cookie_raw),
+                )
+        try:
+            return handler(request)
+        finally:
+            # The session hasn't been used.
+            unused = request.environ.pop(PREFETCH_KEY, None)
+            if unused is not None:
+                unused[1].cancel()
+
+    return prefetch_tween
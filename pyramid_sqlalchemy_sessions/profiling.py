@@ -0,0 +1,187 @@
+import atexit
+import os
+import threading
+import weakref
+from time import monotonic
+
+
+PROFILE_ENV = 'PYRAMID_SESSION_PROFILE'
+
+# Profilers dumped at exit by a single hook per process.
+_profilers = weakref.WeakSet()
+_profilers_lock = threading.Lock()
+_atexit_registered = False
+
+
+def _dump_profilers():
+    for profiler in list(_profilers):
+        profiler.dump()
+
+
+def _register_profiler(profiler):
+    global _atexit_registered
+    with _profilers_lock:
+        if not _atexit_registered:
+            atexit.register(_dump_profilers)
+            _atexit_registered = True
+        _profilers.add(profiler)
+
+
+class _Profiler():
+    """ Base class of profilers aggregating sampled session work and
+    dumping the aggregate to a file every ``interval`` seconds and at
+    exit. ``{pid}`` in the path is replaced by the process ID, so that
+    worker processes don't overwrite each other's files. """
+    default_path = None
+
+    def __init__(self, path=None, interval=60):
+        self.path = path or self.default_path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_dump = monotonic()
+        self._samples = 0
+        _register_profiler(self)
+
+    def run(self, func, *args):
+        """ Call ``func`` with ``args`` under the profiler. """
+        raise NotImplementedError
+
+    def _collected(self):
+        """ Called with the lock held after a sample is added. """
+        self._samples += 1
+        if monotonic() - self._last_dump >= self.interval:
+            self._dump()
+
+    def dump(self):
+        """ Write aggregated stats to the file. """
+        with self._lock:
+            self._dump()
+
+    def _dump(self):
+        self._last_dump = monotonic()
+        if not self._samples:
+            return
+        path = self.path.format(pid=os.getpid())
+        # Replace the file atomically, so that readers never see
+        # a partially written file.
+        tmp_path = path + '.tmp'
+        self._write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _write(self, path):
+        raise NotImplementedError
+
+
+# Profiler modules are imported on use, so that importing the package
+# doesn't pay for them when profiling is off.
+
+
+class CProfileProfiler(_Profiler):
+    """ Aggregates cProfile stats of the samples. The file is in
+    :mod:`pstats` format. """
+    default_path = 'session-profile-{pid}.prof'
+
+    def __init__(self, path=None, interval=60):
+        super().__init__(path, interval)
+        self._stats = None
+
+    def run(self, func, *args):
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active, don't interfere with it.
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self._collected()
+
+    def _write(self, path):
+        self._stats.dump_stats(path)
+
+
+class TracemallocProfiler(_Profiler):
+    """ Aggregates memory allocated during the samples and still alive at
+    their end, by source line. Tracing is on only while samples run, unless
+    it has been started by someone else. The file is a text report of the
+    lines allocating the most.
+
+    Only memory allocated since the start of a sample is counted, so traces
+    collected before it, e.g. by someone else tracing, are excluded. Memory
+    allocated meanwhile by other threads is counted, as tracemalloc doesn't
+    tell threads apart. """
+    default_path = 'session-profile-{pid}.txt'
+    limit = 100
+
+    def __init__(self, path=None, interval=60):
+        super().__init__(path, interval)
+        self._active = 0
+        self._started = False
+        self._lines = {}
+
+    def run(self, func, *args):
+        import tracemalloc
+        with self._lock:
+            if not self._active and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started = True
+            self._active += 1
+        start = self._snapshot(tracemalloc)
+        try:
+            return func(*args)
+        finally:
+            stats = self._snapshot(tracemalloc).compare_to(start, 'lineno')
+            with self._lock:
+                self._active -= 1
+                if not self._active and self._started:
+                    # Clears the traces, so the next sample starts afresh.
+                    tracemalloc.stop()
+                    self._started = False
+                for stat in stats:
+                    if stat.size_diff <= 0:
+                        continue
+                    frame = stat.traceback[0]
+                    key = (frame.filename, frame.lineno)
+                    size, count = self._lines.get(key, (0, 0))
+                    self._lines[key] = (
+                        size + stat.size_diff,
+                        count + stat.count_diff,
+                    )
+                self._collected()
+
+    @staticmethod
+    def _snapshot(tracemalloc):
+        # Leave out the snapshots themselves.
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+
+    def _write(self, path):
+        import linecache
+        lines = sorted(self._lines.items(), key=lambda i: -i[1][0])
+        with open(path, 'w') as f:
+            f.write('# %d samples, top %d lines by allocated size\n'
+                    % (self._samples, self.limit))
+            for (filename, lineno), (size, count) in lines[:self.limit]:
+                f.write('%10.1f KiB %8d blocks  %s:%d  %s\n' % (
+                    size / 1024,
+                    count,
+                    filename,
+                    lineno,
+                    linecache.getline(filename, lineno).strip(),
+                ))
+
+
+PROFILERS = {
+    'cprofile': CProfileProfiler,
+    'tracemalloc': TracemallocProfiler,
+}
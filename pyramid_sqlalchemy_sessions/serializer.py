@@ -3,8 +3,6 @@ from base64 import (
     urlsafe_b64encode,
 )
 
-from Cryptodome.Cipher import AES
-
 from .exceptions import (
     InvalidCookieError,
     CookieCryptoError,
@@ -28,6 +26,10 @@ class AESGCMBytestore():
                 % repr(SECRET_SIZES)
             )
         self.secret = secret
+        # Imported here to keep the package import cheap for processes
+        # that don't handle cookies, e.g. GC.
+        from Cryptodome.Cipher import AES
+        self._aes = AES
 
     def loads(self, encoded):
         try:
@@ -49,7 +51,7 @@ class AESGCMBytestore():
         # Support AAD ?
         nonce = decoded[:n]
         tag = decoded[n:n + t]
-        cipher = AES.new(self.secret, AES.MODE_GCM, nonce)
+        cipher = self._aes.new(self.secret, self._aes.MODE_GCM, nonce)
         try:
             data = cipher.decrypt_and_verify(ciphertext, tag)
         except ValueError as e:
@@ -57,7 +59,7 @@ class AESGCMBytestore():
         return data
 
     def dumps(self, data):
-        cipher = AES.new(self.secret, AES.MODE_GCM)
+        cipher = self._aes.new(self.secret, self._aes.MODE_GCM)
         ciphertext, tag = cipher.encrypt_and_digest(data)
         encoded = urlsafe_b64encode(cipher.nonce + tag + ciphertext)
         return encoded
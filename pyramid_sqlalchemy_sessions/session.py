@@ -1,8 +1,17 @@
 import base64
+import hashlib
+import hmac
+import itertools
+import json
 import logging
 import os
+import pickle
+import struct
+import types
 import uuid
+import zlib
 from collections import UserDict
+from time import perf_counter
 from zope.interface import implementer
 
 from pyramid.compat import (
@@ -12,6 +21,10 @@ from pyramid.compat import (
 )
 from pyramid.interfaces import ISession
 from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import defer
+from sqlalchemy.orm.attributes import set_committed_value
+from zope.sqlalchemy import mark_changed
 
 from .config import (
     get_config_defaults,
@@ -25,18 +38,28 @@ from .config.settings import (
     _ConfigIdleSettings,
     _ConfigRenewalSettings,
 )
+from .core import (
+    KeyValueData,
+    get_statements,
+)
 from .events import (
+    BreakerClosedEvent,
+    BreakerOpenedEvent,
     InvalidCookieErrorEvent,
     CookieCryptoErrorEvent,
     RenewalViolationEvent,
 )
 from .exceptions import (
+    ConfigurationError,
     InvalidCookieError,
     CookieCryptoError,
     InconsistentDataError,
+    SessionConflictError,
 )
 from .model import CSRF_TOKEN_SIZE
+from .profiling import PROFILERS
 from .util import (
+    probable_truth,
     weighted_truth,
     int_now,
 )
@@ -46,7 +69,19 @@ def initializes_session(meth):
     """ Decorator which initializes the session when decorated method is
     called. """
     def wrapper(session, *arg, **kw):
-        if session._session is None:
+        if not session._initialized:
+            session._init_request_session()
+        return meth(session, *arg, **kw)
+    wrapper.__doc__ = meth.__doc__
+    return wrapper
+
+
+def reads_session(meth):
+    """ Decorator for read-only methods, which initializes the session
+    unless the request has no session cookie: such requests read the empty
+    null session instead, until the first write initializes the session. """
+    def wrapper(session, *arg, **kw):
+        if not session._initialized and not session._null_session():
             session._init_request_session()
         return meth(session, *arg, **kw)
     wrapper.__doc__ = meth.__doc__
@@ -58,7 +93,7 @@ def notifies_changed_data(meth):
     notifying the session that the main data dict may have dirty data,
     including deeply nested changes. """
     def wrapper(session, *arg, **kw):
-        if session._session is None:
+        if not session._initialized:
             session._init_request_session()
         session.changed()
         return meth(session, *arg, **kw)
@@ -66,6 +101,15 @@ def notifies_changed_data(meth):
     return wrapper
 
 
+# Data and flash queues of the null session.
+_NULL_DATA = types.MappingProxyType({})
+
+# WSGI environ key of the cookie and the future of the prefetch tween.
+PREFETCH_KEY = 'pyramid_sqlalchemy_sessions.prefetch'
+# Marks a session row which hasn't been prefetched.
+_NOT_PREFETCHED = object()
+
+
 class SessionProperty:
     """ Simple descriptor that will proxy reads and writes to the attached
     ORM session instance and mark the session dirty on writes. """
@@ -73,12 +117,12 @@ class SessionProperty:
         self.name = name
 
     def __get__(self, obj, type=None):
-        if obj._session is None:
+        if not obj._initialized:
             obj._init_request_session()
         return getattr(obj._session, self.name)
 
     def __set__(self, obj, value):
-        if obj._session is None:
+        if not obj._initialized:
             obj._init_request_session()
         setattr(obj._session, self.name, value)
         obj._dirty = True
@@ -117,8 +161,22 @@ def get_session_factory(serializer, model_class, **kw):
         'enable_userid': _UseridSession,
         'enable_csrf': _CSRFSession,
         'enable_configcookie': _ConfigCookieSession,
+        'enable_version': _VersionSession,
+        'enable_keyvalue': _KeyValueDataSession,
+    }
+    flash_storages = {
+        'cookie': _CookieFlashSession,
+        'cache': _CacheFlashSession,
     }
     bases = [_BaseSession]
+    if settings['core_persistence']:
+        bases.append(_CoreSession)
+    if settings['persistence_engine'] is not None:
+        bases.append(_AutocommitSession)
+    if settings['persistence_mode'] == 'callback':
+        bases.append(_CallbackPersistenceSession)
+    if settings['flash_storage'] in flash_storages:
+        bases.append(flash_storages[settings['flash_storage']])
     for name, mixin in mixin_features.items():
         if settings[name]:
             bases.append(mixin)
@@ -130,18 +188,61 @@ def get_session_factory(serializer, model_class, **kw):
     for name, mixins in mixin_config_features.items():
         if settings[name] is not None:
             bases.append(mixins[0] if settings[name] else mixins[1])
+    if settings['enable_hmac_renewal']:
+        bases.append(_HMACRenewalSession)
+    if settings['circuit_breaker'] is not None:
+        bases.append(_BreakerSession)
+    if settings['metrics'] is not None:
+        bases.append(_MetricsSession)
+    if settings['profile'] is not None:
+        bases.append(_ProfiledSession)
     bases = tuple(reversed(bases))
     cls = type('FrankenSession', bases, {})
+    logger = logging.getLogger(__name__)
     attrs = {
-        '_logger': logging.getLogger(__name__)
+        '_logger': logger,
+        # Checked before building log messages on hot paths. Computed once
+        # per factory, so logging has to be configured before the factory
+        # is created.
+        '_log_debug': logger.isEnabledFor(logging.DEBUG),
+        '_log_info': logger.isEnabledFor(logging.INFO),
+        '_statements': get_statements(model_class),
     }
+    engine = settings['persistence_engine']
+    if engine is not None:
+        if settings['statement_cache']:
+            engine = engine.execution_options(
+                compiled_cache=attrs['_statements'].compiled_cache,
+            )
+        attrs['_persistence_bind'] = engine
+    if settings['enable_hmac_renewal']:
+        attrs['_renewal_key'] = _renewal_key(serializer)
+    if settings['profile'] is not None:
+        attrs['_profiler'] = PROFILERS[settings['profile']](
+            settings['profile_file'],
+            settings['profile_interval'],
+        )
     for name, value in settings.items():
+        if isinstance(value, types.FunctionType):
+            # Don't turn callable settings into methods.
+            value = staticmethod(value)
         attrs['_' + name] = value
     for name, value in attrs.items():
         setattr(cls, name, value)
     return cls
 
 
+def _renewal_key(serializer):
+    """ Derive the key of renewal ids from the serializer secret. """
+    secret = getattr(serializer, 'secret', None)
+    if not isinstance(secret, bytes):
+        raise ConfigurationError(
+            "HMACRenewalMixin requires a serializer with a bytes secret"
+            " attribute."
+        )
+    return hmac.new(secret, b'renewal_id', hashlib.sha256).digest()
+
+
 @implementer(ISession)
 class _ISessionSession(UserDict):
     """ Session mixin implementing ISession API """
@@ -167,15 +268,7 @@ class _ISessionSession(UserDict):
     def invalidate(self):
         """ Invalidate the current session. """
         self.clear()
-        state = inspect(self._session)
-        # Deleted and detached states should not be possible.
-        log_msg = "Invalidating %s session %s"
-        if state.persistent:
-            self._logger.info(log_msg % ('persistent', self._session.id))
-            self._delete_session(self._session)
-        elif state.pending:
-            self._logger.info(log_msg % ('pending', self._session.id))
-            self._dbsession.expunge(self._session)
+        self._discard_session(self._session)
         self.settings.discard()
         self._init_session_instance()
 
@@ -183,33 +276,34 @@ class _ISessionSession(UserDict):
     def flash(self, msg, queue='', allow_duplicate=True):
         assert isinstance(msg, str)
         assert isinstance(queue, str)
-        storage = self._session.flash.setdefault(queue, [])
+        storage = self._flash_queues().setdefault(queue, [])
         if allow_duplicate or (msg not in storage):
             storage.append(msg)
-            self._dirty = True
+            self._flash_changed()
 
     @initializes_session
     def pop_flash(self, queue=''):
-        if len(self._session.flash):
-            storage = self._session.flash.pop(queue, [])
-            self._dirty = True
+        queues = self._flash_queues()
+        if len(queues):
+            storage = queues.pop(queue, [])
+            self._flash_changed()
             return storage
         else:
             return []
 
-    @initializes_session
+    @reads_session
     def peek_flash(self, queue=''):
-        storage = self._session.flash.get(queue, [])
+        storage = self._flash_queues().get(queue, [])
         return storage
 
-    get = initializes_session(UserDict.get)
-    __getitem__ = initializes_session(UserDict.__getitem__)
-    items = initializes_session(UserDict.items)
-    values = initializes_session(UserDict.values)
-    keys = initializes_session(UserDict.keys)
-    __contains__ = initializes_session(UserDict.__contains__)
-    __len__ = initializes_session(UserDict.__len__)
-    __iter__ = initializes_session(UserDict.__iter__)
+    get = reads_session(UserDict.get)
+    __getitem__ = reads_session(UserDict.__getitem__)
+    items = reads_session(UserDict.items)
+    values = reads_session(UserDict.values)
+    keys = reads_session(UserDict.keys)
+    __contains__ = reads_session(UserDict.__contains__)
+    __len__ = reads_session(UserDict.__len__)
+    __iter__ = reads_session(UserDict.__iter__)
 
     clear = notifies_changed_data(UserDict.clear)
     update = notifies_changed_data(UserDict.update)
@@ -222,11 +316,17 @@ class _ISessionSession(UserDict):
 
 class _BaseSession(_ISessionSession):
     """ Provides minimal working session without any extra features. """
+    # Whether flash messages are stored in the flash column of the row.
+    _flash_in_row = True
+
     def __init__(self, request):
         self.request = request
         self._new = True
         self._dbsession = getattr(request, self._dbsession_name)
-        self._session = None
+        self._initialized = False
+        self._instance = None
+        self._pending = False
+        self._new_flash = _NULL_DATA
         self._cookieval = None
         self._cookie_callback_added = False
         self._existing_invalidated = False
@@ -234,6 +334,31 @@ class _BaseSession(_ISessionSession):
         self._new_cookie = None
         self._renewal_id = None
         self._settings = None
+        self._null = False
+        self._time = None
+
+    def _now(self):
+        """ Return the current timestamp, taken once per request, so that
+        all checks and expirations of the request use the same time. """
+        now = self._time
+        if now is None:
+            clock = self._clock
+            now = self._time = int_now() if clock is None else clock()
+        return now
+
+    def _null_session(self):
+        """ Use the null session, unless the request has a session cookie.
+        The null session is empty and read-only: it doesn't create a model
+        instance or attach TM hooks. Return False if the session has to be
+        initialized. """
+        if self._cookie_name in self.request.cookies:
+            return False
+        if not self._null:
+            self._null = True
+            self.data = _NULL_DATA
+            # Responses still depend on the absence of the cookie.
+            self._add_vary_callback()
+        return True
 
     def _init_request_session(self):
         """ Try to init session instance based on request data """
@@ -241,7 +366,7 @@ class _BaseSession(_ISessionSession):
         cookie_raw = self.request.cookies.get(self._cookie_name)
         if cookie_raw is not None:
             try:
-                unpacked = self._serializer.loads(bytes_(cookie_raw))
+                unpacked = self._unpack_cookie(cookie_raw)
                 id = uuid.UUID(bytes=unpacked[:16])
                 session = self._load_session(id)
                 if session is not None and self._config_renewal is not None:
@@ -254,31 +379,32 @@ class _BaseSession(_ISessionSession):
 
             except InvalidCookieError as exc:
                 self._logger.warning(
-                    'Invalid session cookie found (%s).' % cookie_raw
+                    'Invalid session cookie found (%s).', cookie_raw
                 )
                 self._fire_event(InvalidCookieErrorEvent, exc)
             except CookieCryptoError as exc:
                 self._logger.warning(
-                    'Could not decrypt/authenticate session cookie (%s).'
-                    % cookie_raw
+                    'Could not decrypt/authenticate session cookie (%s).',
+                    cookie_raw,
                 )
                 self._fire_event(CookieCryptoErrorEvent, exc)
             except (ValueError, IndexError):
                 # The cookie is authenticated, so there was a mistake or a
                 # change of settings.
                 self._logger.warning(
-                    'Authentic session cookie has invalid data (%s).'
-                    % cookie_raw
+                    'Authentic session cookie has invalid data (%s).',
+                    cookie_raw,
                 )
                 # Don't use session if we could not unpack renewal_id
                 session = None
 
             if session is not None:
                 if not self._is_valid_session(session):
-                    self._logger.debug(
-                        'Deleting invalid session from the db (%s).'
-                        % session.id
-                    )
+                    if self._log_debug:
+                        self._logger.debug(
+                            'Deleting invalid session from the db (%s).',
+                            session.id,
+                        )
                     self._delete_session(session)
                     session = None
             else:
@@ -297,7 +423,16 @@ class _BaseSession(_ISessionSession):
                 self._add_cookie_callback()
         self._init_session_instance(session)
         self._attach_before_commit()
-        self._add_vary_callback()
+        if not self._null:
+            self._add_vary_callback()
+
+    def _unpack_cookie(self, cookie_raw):
+        """ Decrypt and authenticate session cookie value. """
+        return self._serializer.loads(bytes_(cookie_raw))
+
+    def _pack_cookie(self, value):
+        """ Encrypt session cookie value. """
+        return native_(self._serializer.dumps(value))
 
     def _fire_event(self, event_class, exception=None):
         event = event_class(self.request, exception)
@@ -305,15 +440,108 @@ class _BaseSession(_ISessionSession):
 
     def _load_session(self, id):
         """ Load session instance from the database. """
-        return self._dbsession.query(self._model_class).get(id)
+        if self._statement_cache:
+            return self._statements.load_instance(
+                self._dbsession, id, self._flash_in_row
+            )
+        query = self._dbsession.query(self._model_class)
+        if not self._flash_in_row:
+            query = query.options(defer('flash'))
+        return query.get(id)
 
     def _delete_session(self, session):
         """ Delete session instance from the database """
         if not self._new:
             self._delete_session_cookie(session)
             self._existing_invalidated = True
+        self._remove_session(session)
+
+    def _discard_session(self, session):
+        """ Forget the session instance on invalidation, deleting it from
+        the database if it has been persisted already. """
+        state = inspect(session)
+        # Deleted and detached states should not be possible.
+        log_msg = "Invalidating %s session %s"
+        if state.persistent:
+            if self._log_info:
+                self._logger.info(log_msg, 'persistent', session.id)
+            self._delete_session(session)
+        elif state.pending:
+            if self._log_info:
+                self._logger.info(log_msg, 'pending', session.id)
+            self._dbsession.expunge(session)
+
+    def _create_session(self, args):
+        """ Create new session instance (not added to the database). """
+        return self._model_class(**args)
+
+    def _add_session(self, session):
+        """ Add new session instance to the database. """
+        self._dbsession.add(session)
+
+    def _save_session(self, session):
+        """ Save changes of the existing session instance. The ORM unit of
+        work flushes dirty instances on commit, so there's nothing to do."""
+
+    def _remove_session(self, session):
+        """ Delete session instance from the database. """
         self._dbsession.delete(session)
 
+    def _flush_session(self):
+        """ Write pending changes of session instances right away, instead
+        of on commit. Other pending changes of the dbsession are left to the
+        commit. """
+        dbsession = self._dbsession
+        pending = [
+            obj for obj in itertools.chain(
+                dbsession.new,
+                dbsession.dirty,
+                dbsession.deleted,
+            )
+            if isinstance(obj, self._model_class)
+        ]
+        if pending:
+            dbsession.flush(pending)
+
+    def _changed_attributes(self, session):
+        """ Return names of changed attributes of the session instance. """
+        return {
+            attr.key for attr in inspect(session).attrs
+            if attr.history.has_changes()
+        }
+
+    def _mark_saved(self, session, values):
+        """ Mark the session instance as saved with the attribute values, when
+        it has been saved bypassing the ORM. """
+        for key, value in values.items():
+            set_committed_value(session, key, value)
+
+    def _flash_queues(self):
+        """ Return dict of flash message queues. """
+        if self._instance is None:
+            # Null session, or a new session not created yet.
+            return self._new_flash
+        return self._instance.flash
+
+    def _flash_changed(self):
+        """ Mark flash message queues as changed. """
+        self._dirty = True
+
+    def _connection(self):
+        """ Return connection of the dbsession for Core statements. """
+        return self._statements.connection(
+            self._dbsession,
+            self._statement_cache,
+        )
+
+    def _write(self):
+        """ Return connection for Core write statements. """
+        conn = self._connection()
+        # Writes bypassing the ORM must be explicitly reported to
+        # zope.sqlalchemy, otherwise the transaction won't be committed.
+        mark_changed(self._dbsession, self.request.tm)
+        return conn
+
     def _delete_session_cookie(self, session):
         # Don't call add_cookie_callback: it will be called later depending on
         # commit success.
@@ -331,26 +559,53 @@ class _BaseSession(_ISessionSession):
             response.delete_cookie(**cookie)
         self._cookie_action = delete_action
 
+    @property
+    def _session(self):
+        """ Session model instance, or None if the session has not been
+        initialized. The instance of a new session is created on first
+        access, so that clean new sessions don't create any. """
+        if self._pending:
+            self._pending = False
+            self._instance = self._create_new_session()
+        return self._instance
+
     def _init_session_instance(self, session=None):
-        """ Initialize existing session ORM instance or a new instance. """
+        """ Initialize existing session ORM instance or a new session. """
         if session is not None:
-            self._logger.info('Initializing existing session %s' % session.id)
+            if self._log_info:
+                self._logger.info('Initializing existing session %s',
+                                  session.id)
             self._new = False
+            self._pending = False
+            self._instance = session
+            self.data = session.data
         else:
             self._new = True
-            args = self._new_session_args()
-            session = self._model_class(**args)
-            self._logger.info('Creating new session %s' % session.id)
-        self.data = session.data
-        self._session = session
+            self._pending = True
+            self._instance = None
+            self.data = {}
+            self._new_flash = {}
+        self._initialized = True
         self._dirty = False
 
+    def _create_new_session(self):
+        """ Create the instance of a new session, using data and flash
+        queues stored before its creation. """
+        args = self._new_session_args()
+        session = self._create_session(args)
+        if 'data' in args:
+            # The model may coerce the dict, e.g. into a mutable dict.
+            self.data = session.data
+        if self._log_info:
+            self._logger.info('Creating new session %s', session.id)
+        return session
+
     def _new_session_args(self):
         return {
             'id': uuid.UUID(bytes=os.urandom(16)),
-            'data': {},
-            'flash': {},
-            'created': int_now(),
+            'data': self.data,
+            'flash': self._new_flash,
+            'created': self._now(),
         }
 
     def _is_valid_session(self, session):
@@ -359,44 +614,60 @@ class _BaseSession(_ISessionSession):
 
     def _is_empty_session(self, session):
         """ Check if the model instance contains empty session """
-        return len(session.data) == 0 and len(session.flash) == 0
+        return len(self.data) == 0 and len(self._flash_queues()) == 0
+
+    def _add_before_commit_hook(self, hook):
+        """ Call the hook before the dbsession is committed. """
+        self.request.tm.get().addBeforeCommitHook(hook)
+
+    def _add_after_commit_hook(self, hook):
+        """ Call the hook with the commit status after the dbsession is
+        committed. """
+        self.request.tm.get().addAfterCommitHook(hook)
 
     def _attach_before_commit(self):
-        def tm_before_commit():
+        self._add_before_commit_hook(self._tm_before_commit)
+
+    def _tm_before_commit(self):
+        """ TM 'before commit' hook persisting the session. """
+        if self._log_debug:
             self._logger.debug('Running before commit TM hook')
-            # Discard unsaved settings if any.
-            self.settings.discard()
+        # Discard unsaved settings if any.
+        self.settings.discard()
+        if self.new:
+            if self._dirty:
+                s = self._session
+                if self._is_empty_session(s):
+                    self._dirty = False
+                else:
+                    self._cookieval = s.id.bytes
+                    if self.settings.renewal_timeout is not None:
+                        self._cookieval += self._current_renewal_id(s).bytes
+        else:
+            # Check if we need to run the renewal procedure.
+            if self._config_renewal is not None:
+                self._renewal()
+
+            # Check if we need to force the extension of the session.
+            if self._config_idle is not None:
+                self._maybe_extend()
+
+        if self._dirty:
             s = self._session
+            if self.settings.idle_timeout is not None:
+                s.idle_expire = self._now() + self.settings.idle_timeout
             if self.new:
-                if self._dirty:
-                    if self._is_empty_session(s):
-                        self._dirty = False
-                    else:
-                        self._logger.debug(
-                            'Adding new session %s to dbsession' % s.id
-                        )
-                        self._dbsession.add(s)
-                        self._cookieval = s.id.bytes
-                        if self.settings.renewal_timeout is not None:
-                            self._cookieval += s.renewal_id.bytes
+                if self._log_debug:
+                    self._logger.debug(
+                        'Adding new session %s to dbsession', s.id
+                    )
+                self._add_session(s)
             else:
-                # Check if we need to run the renewal procedure.
-                if self._config_renewal is not None:
-                    self._renewal()
+                self._save_session(s)
 
-                # Check if we need to force the extension of the session.
-                if self._config_idle is not None:
-                    self._maybe_extend()
-
-            if self.settings.idle_timeout is not None and self._dirty:
-                s.idle_expire = int_now() + self.settings.idle_timeout
-
-            if self.new and (self._dirty or self._existing_invalidated):
-                # Txn: insert new session or delete existing.
-                self._attach_after_commit()
-
-        txn = self.request.tm.get()
-        txn.addBeforeCommitHook(tm_before_commit)
+        if self.new and (self._dirty or self._existing_invalidated):
+            # Txn: insert new session or delete existing.
+            self._attach_after_commit()
 
     def _add_cookie_callback(self):
         """ Add response callback to manage Set-Cookie header. """
@@ -418,19 +689,10 @@ class _BaseSession(_ISessionSession):
 
     def _attach_after_commit(self):
         """ Add TM 'after commit' callback. """
-        def tm_after_commit(status):
-            # Don't set cookies on rollbacks. Note: successful read only txn
-            # also has status = True.
-            if status and (self._dirty or self._existing_invalidated):
-                self._logger.debug('Successful TM commit.')
-                self._add_cookie_callback()
-                if self._new_cookie is not None:
-                    def setcookie_action(response):
-                        response.set_cookie(**self._new_cookie)
-                    self._cookie_action = setcookie_action
+        self._add_after_commit_hook(self._tm_after_commit)
+        self._prepare_new_cookie()
 
-        txn = self.request.tm.get()
-        txn.addAfterCommitHook(tm_after_commit)
+    def _prepare_new_cookie(self):
         # Prepare the cookie to set later. Note: we assume after this point no
         # changes will happen to the cookie settings or the payload,
         # because we only call this method once before the commit:
@@ -441,12 +703,27 @@ class _BaseSession(_ISessionSession):
                 'name': self._cookie_name,
                 'path': self.settings.cookie_path,
                 'domain': self.settings.cookie_domain,
-                'value': native_(self._serializer.dumps(self._cookieval)),
+                'value': self._pack_cookie(self._cookieval),
                 'max_age': self.settings.cookie_max_age,
                 'secure': self.settings.cookie_secure,
                 'httponly': self.settings.cookie_httponly,
             }
 
+    def _tm_after_commit(self, status):
+        """ TM 'after commit' hook managing the session cookie. """
+        # Don't set cookies on rollbacks. Note: successful read only txn
+        # also has status = True. A new cookie without changes is sent by
+        # HMAC renewal.
+        if status and (self._dirty or self._existing_invalidated or
+                       self._new_cookie is not None):
+            if self._log_debug:
+                self._logger.debug('Successful TM commit.')
+            self._add_cookie_callback()
+            if self._new_cookie is not None:
+                def setcookie_action(response):
+                    response.set_cookie(**self._new_cookie)
+                self._cookie_action = setcookie_action
+
     def new_csrf_token(self):
         self._raise_not_implemented('CSRFMixin')
 
@@ -484,6 +761,497 @@ class _BaseSession(_ISessionSession):
         return [SessionSettings, _BaseSettings]
 
 
+class _CoreSession:
+    """ Session mixin loading and persisting session rows using Core
+    statements and lightweight records instead of ORM instances. """
+    def changed(self):
+        if not self._initialized:
+            self._init_request_session()
+        self._dirty = True
+        # Records of new sessions are inserted with all columns anyway.
+        if self._instance is not None:
+            self._instance.mark_changed('data')
+
+    def _flash_changed(self):
+        self._dirty = True
+        if self._instance is not None:
+            self._instance.mark_changed('flash')
+
+    def _load_session(self, id):
+        return self._statements.load_record(
+            self._connection(), id, self._flash_in_row
+        )
+
+    def _discard_session(self, session):
+        if session._persistent:
+            if self._log_info:
+                self._logger.info(
+                    "Invalidating persistent session %s", session.id
+                )
+            self._delete_session(session)
+
+    def _create_session(self, args):
+        return self._statements.new_record(**args)
+
+    def _add_session(self, session):
+        self._statements.insert_record(self._write(), session)
+
+    def _save_session(self, session):
+        self._statements.update_record(self._write(), session)
+
+    def _remove_session(self, session):
+        self._statements.delete_record(self._write(), session)
+
+    def _flush_session(self):
+        # Statements are executed right away.
+        pass
+
+    def _changed_attributes(self, session):
+        return session._changed & set(self._statements.keys)
+
+    def _mark_saved(self, session, values):
+        for key, value in values.items():
+            setattr(session, key, value)
+        session._mark_persistent()
+
+
+class _CallbackPersistenceSession:
+    """ Session mixin persisting the session from a response callback and
+    committing the dbsession explicitly, without a transaction manager.
+    Commit hooks are called from the callback in the same way. """
+    _before_commit_hooks = ()
+    _after_commit_hooks = ()
+
+    def _add_before_commit_hook(self, hook):
+        self._before_commit_hooks += (hook,)
+
+    def _add_after_commit_hook(self, hook):
+        self._after_commit_hooks += (hook,)
+
+    def _attach_before_commit(self):
+        self.request.add_response_callback(self._persist_callback)
+        super()._attach_before_commit()
+
+    def _write(self):
+        # The dbsession isn't joined to a transaction manager.
+        return self._connection()
+
+    def _add_cookie_callback(self):
+        # The cookie is managed by the persist callback instead: a cookie
+        # callback added before it (e.g. deleting an invalid cookie) would
+        # run before the session is persisted.
+        self._cookie_callback_added = True
+
+    def _persist_callback(self, request, response):
+        # Same as aborting the transaction on exceptions.
+        if getattr(request, 'exception', None) is None:
+            self._persist()
+        if self._cookie_callback_added and self._cookie_action is not None:
+            self._cookie_action(response)
+
+    def _persist(self):
+        dbsession = self._dbsession
+        try:
+            # Hooks may add more hooks.
+            while self._before_commit_hooks:
+                hook = self._before_commit_hooks[0]
+                self._before_commit_hooks = self._before_commit_hooks[1:]
+                hook()
+            dbsession.commit()
+        except Exception:
+            dbsession.rollback()
+            self._call_after_commit_hooks(False)
+            raise
+        self._call_after_commit_hooks(True)
+
+    def _call_after_commit_hooks(self, status):
+        hooks, self._after_commit_hooks = self._after_commit_hooks, ()
+        for hook in hooks:
+            hook(status)
+
+
+class _AutocommitSession:
+    """ Session mixin running Core statements through a separate engine
+    instead of the dbsession. Each write commits on its own, so session row
+    locks are held for a single statement rather than for the application
+    transaction.
+
+    The engine is thread-safe, so the cookie can also be decrypted and the
+    row loaded ahead by the prefetch tween. """
+    _prefetched = _NOT_PREFETCHED
+
+    @classmethod
+    def _prefetch(cls, cookie_raw):
+        """ Decrypt the cookie and load the session row, in a thread of the
+        prefetch tween. Return the unpacked cookie and the prefetched row. """
+        unpacked = cls._serializer.loads(bytes_(cookie_raw))
+        start = perf_counter()
+        try:
+            id = uuid.UUID(bytes=unpacked[:16])
+            record = cls._statements.load_record(
+                cls._persistence_bind, id, cls._flash_in_row
+            )
+        except Exception:
+            # The request loads the row again, and handles the error.
+            return unpacked, _NOT_PREFETCHED
+        return unpacked, (id, record, perf_counter() - start)
+
+    def _unpack_cookie(self, cookie_raw):
+        prefetch = self.request.environ.pop(PREFETCH_KEY, None)
+        # Do the work in the request thread if it hasn't started yet.
+        if (prefetch is None or prefetch[0] != cookie_raw or
+                prefetch[1].cancel()):
+            return super()._unpack_cookie(cookie_raw)
+        # Cookie errors are raised again here.
+        unpacked, self._prefetched = prefetch[1].result()
+        return unpacked
+
+    def _load_session(self, id):
+        prefetched = self._prefetched
+        self._prefetched = _NOT_PREFETCHED
+        if prefetched is not _NOT_PREFETCHED and prefetched[0] == id:
+            self._prefetch_duration = prefetched[2]
+            return prefetched[1]
+        return super()._load_session(id)
+
+    def _connection(self):
+        # The engine checks out a pool connection per statement.
+        return self._persistence_bind
+
+    def _write(self):
+        # Nothing to report to zope.sqlalchemy: the dbsession isn't used.
+        return self._persistence_bind
+
+
+def _snapshot(data):
+    """ Return pickled values of the data dict by key. """
+    return {
+        key: pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        for key, value in (data or {}).items()
+    }
+
+
+# Values which can't be changed in place.
+_IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def _key_changed(snapshot, data, key):
+    """ Check if the data key has changed since the snapshot. """
+    if key not in data:
+        return key in snapshot
+    if key not in snapshot:
+        return True
+    return snapshot[key] != pickle.dumps(data[key], pickle.HIGHEST_PROTOCOL)
+
+
+class _VersionSession:
+    """ Session mixin implementing optimistic concurrency control: saves
+    existing sessions only if the version column has not changed since the
+    session was loaded, otherwise merges concurrent changes and retries. """
+    _conflict_retries = 3
+    # Pickled values of the loaded data by key, to find our changes when
+    # merging. Taken lazily, so that reads don't pickle the data: values
+    # which could be changed in place are taken on their first read, the
+    # rest on the first change of the data.
+    _data_snapshot = None
+    _snapshot_complete = False
+
+    def _load_session(self, id):
+        session = super()._load_session(id)
+        if session is not None:
+            self._loaded_version = session.version
+            if 'data' in self._statements.keys:
+                self._data_snapshot = {}
+                self._snapshot_complete = False
+        return session
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        snapshot = self._data_snapshot
+        if (snapshot is not None and not self._snapshot_complete and
+                key not in snapshot and
+                not isinstance(value, _IMMUTABLE_TYPES)):
+            snapshot[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return value
+
+    def changed(self):
+        self._complete_snapshot()
+        super().changed()
+
+    def _complete_snapshot(self):
+        snapshot = self._data_snapshot
+        if snapshot is None or self._snapshot_complete:
+            return
+        self._snapshot_complete = True
+        for key, value in (self.data or {}).items():
+            if key not in snapshot:
+                snapshot[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _new_session_args(self):
+        args = super()._new_session_args()
+        args['version'] = 1
+        return args
+
+    def _save_session(self, session):
+        statements = self._statements
+        changed = self._changed_attributes(session)
+        conn = self._write()
+        for attempt in range(self._conflict_retries + 1):
+            values = {key: getattr(session, key) for key in changed}
+            version = self._loaded_version
+            if statements.update_versioned(conn, session.id, version, values):
+                values['version'] = version + 1
+                self._mark_saved(session, values)
+                return
+            current = statements.load_record(conn, session.id)
+            if current is None:
+                if self._log_info:
+                    self._logger.info(
+                        'Session %s has been deleted by a concurrent'
+                        ' request',
+                        session.id,
+                    )
+                self._mark_saved(session, values)
+                return
+            if self._log_info:
+                self._logger.info(
+                    'Merging concurrent changes of session %s', session.id
+                )
+            if 'data' in statements.keys:
+                self._merge_data(session.data, current.data)
+                changed.add('data')
+                self._data_snapshot = _snapshot(current.data)
+                self._snapshot_complete = True
+            self._loaded_version = current.version
+        raise SessionConflictError(
+            'Could not save session %s: concurrent modifications.'
+            % session.id
+        )
+
+    def _merge_data(self, ours, theirs):
+        """ Apply our changes of the data dict on top of the concurrently
+        saved data, resolving changes of the same keys. """
+        self._complete_snapshot()
+        snapshot = self._data_snapshot
+        theirs = theirs or {}
+        merged = dict(theirs)
+        conflicts = set()
+        for key in set(ours) | set(snapshot):
+            if not _key_changed(snapshot, ours, key):
+                continue
+            if _key_changed(snapshot, theirs, key):
+                conflicts.add(key)
+            elif key in ours:
+                merged[key] = ours[key]
+            else:
+                merged.pop(key, None)
+        if conflicts:
+            resolved = self._resolve_conflicts(
+                {key: ours[key] for key in conflicts if key in ours},
+                {key: theirs[key] for key in conflicts if key in theirs},
+            )
+            for key in conflicts:
+                if key in resolved:
+                    merged[key] = resolved[key]
+                else:
+                    merged.pop(key, None)
+        ours.clear()
+        ours.update(merged)
+
+    def _resolve_conflicts(self, ours, theirs):
+        """ Given dicts of conflicting keys changed by us and by a concurrent
+        request (missing keys were deleted), return dict of resolved values.
+        By default our changes win. """
+        if self._conflict_resolver is None:
+            return ours
+        return self._conflict_resolver(self.request, ours, theirs)
+
+
+class _FlashStorageSession:
+    """ Base of session mixins storing flash messages outside of the session
+    row. Changed messages are stored after successful commit. """
+    _flash_in_row = False
+    _flash = None
+    _flash_dirty = False
+
+    def _flash_queues(self):
+        if self._flash is None:
+            self._flash = self._load_flash()
+        return self._flash
+
+    def _flash_changed(self):
+        if not self._flash_dirty:
+            self._flash_dirty = True
+            self._add_after_commit_hook(self._flash_after_commit)
+
+    def _discard_session(self, session):
+        super()._discard_session(session)
+        self._flash = {}
+        self._flash_changed()
+
+    def _new_session_args(self):
+        args = super()._new_session_args()
+        args['flash'] = None
+        return args
+
+    def _load_flash(self):
+        """ Return stored flash message queues. """
+        raise NotImplementedError
+
+    def _flash_after_commit(self, status):
+        """ Store changed flash message queues. """
+        raise NotImplementedError
+
+
+class _CookieFlashSession(_FlashStorageSession):
+    """ Session mixin storing flash messages in a separate cookie, so that
+    flash messages never cause writes of the session row. """
+    @property
+    def _flash_cookie_name(self):
+        return self._cookie_name + '_flash'
+
+    def _is_empty_session(self, session):
+        # Flash messages alone don't need a session row.
+        return len(self.data) == 0
+
+    def _load_flash(self):
+        cookie_raw = self.request.cookies.get(self._flash_cookie_name)
+        if cookie_raw is None:
+            return {}
+        try:
+            return json.loads(text_(
+                self._serializer.loads(bytes_(cookie_raw))
+            ))
+        except (InvalidCookieError, CookieCryptoError, ValueError):
+            self._logger.warning(
+                'Invalid flash cookie found (%s).', cookie_raw
+            )
+            return {}
+
+    def _flash_after_commit(self, status):
+        if not status:
+            return
+
+        def flash_cookie_callback(request, response):
+            cookie = {
+                'name': self._flash_cookie_name,
+                'path': self._cookie_path,
+                'domain': self._cookie_domain,
+            }
+            if self._flash:
+                value = self._serializer.dumps(bytes_(json.dumps(self._flash)))
+                response.set_cookie(
+                    value=native_(value),
+                    max_age=None,
+                    secure=self._cookie_secure,
+                    httponly=self._cookie_httponly,
+                    **cookie
+                )
+            elif self._flash_cookie_name in request.cookies:
+                response.delete_cookie(**cookie)
+        self.request.add_response_callback(flash_cookie_callback)
+
+
+class _CacheFlashSession(_FlashStorageSession):
+    """ Session mixin storing flash messages in a cache by session id, so that
+    flash messages don't cause writes of existing session rows. """
+    _flash_stale = ()
+
+    @staticmethod
+    def _flash_key(session):
+        return 'flash:' + session.id.hex
+
+    def _load_flash(self):
+        if self._new:
+            return {}
+        value = self._flash_cache.get(self._flash_key(self._session))
+        if value is None:
+            return {}
+        return json.loads(value)
+
+    def _flash_changed(self):
+        if self._new:
+            # Messages are stored by id, so the session has to be created.
+            self._dirty = True
+        if not self._flash_dirty:
+            self._add_before_commit_hook(self._flash_before_commit)
+        super()._flash_changed()
+
+    def _flash_before_commit(self):
+        # Attributes of the session instance expire on commit.
+        self._flash_commit_key = self._flash_key(self._session)
+
+    def _discard_session(self, session):
+        self._flash_stale += (self._flash_key(session),)
+        super()._discard_session(session)
+
+    def _flash_after_commit(self, status):
+        if not status:
+            return
+        cache = self._flash_cache
+        for key in self._flash_stale:
+            cache.delete(key)
+        key = self._flash_commit_key
+        if self._flash:
+            cache.set(key, json.dumps(self._flash))
+        else:
+            cache.delete(key)
+
+
+class _KeyValueDataSession:
+    """ Session mixin storing session data as a row per key, loaded lazily
+    and written only for changed keys. """
+    def changed(self):
+        if not self._initialized:
+            self._init_request_session()
+        self._dirty = True
+        self.data.changed()
+
+    def _init_session_instance(self, session=None):
+        super()._init_session_instance(session)
+        if self._new:
+            self.data = KeyValueData()
+        else:
+            id = self._session.id
+            self.data = KeyValueData(
+                lambda: self._data_statements.load_rows(
+                    self._connection(),
+                    id,
+                )
+            )
+
+    @property
+    def _data_statements(self):
+        return self._statements.data_statements
+
+    def _new_session_args(self):
+        args = super()._new_session_args()
+        del args['data']
+        return args
+
+    def _add_session(self, session):
+        super()._add_session(session)
+        # Data rows reference the session row.
+        self._dbsession.flush()
+        self._save_data(session)
+
+    def _save_session(self, session):
+        super()._save_session(session)
+        self._save_data(session)
+
+    def _save_data(self, session):
+        if self.data.dirty:
+            self._data_statements.save_data(
+                self._write(),
+                session.id,
+                self.data,
+            )
+
+    def _remove_session(self, session):
+        self._data_statements.delete_rows(self._write(), session.id)
+        super()._remove_session(session)
+
+
 class _CSRFSession:
     """ Session mixin to store csrf token. """
     def _is_empty_session(self, session):
@@ -535,35 +1303,48 @@ class _RenewalSession:
         if renewal_timeout is None:
             return default
 
-        if self._renewal_id != session.renewal_id:
-            if (session.renewal_next is None or
-                self._renewal_id != session.renewal_next):
-
-                self._logger.warning(
-                    "Invalid renewal id found in the cookie of session %s"
-                    % session.id
-                )
-                self._fire_event(RenewalViolationEvent)
-                return False
+        if not self._is_known_renewal_id(session):
+            self._logger.warning(
+                "Invalid renewal id found in the cookie of session %s",
+                session.id,
+            )
+            self._fire_event(RenewalViolationEvent)
+            return False
         return default
 
+    def _is_known_renewal_id(self, session):
+        """ Check the renewal id of the cookie: the current one or the
+        candidate of unfinished renewal. """
+        if self._renewal_id == session.renewal_id:
+            return True
+        return (session.renewal_next is not None and
+                self._renewal_id == session.renewal_next)
+
+    def _current_renewal_id(self, session):
+        return session.renewal_id
+
     def _new_session_args(self):
-        now = int_now()
         args = super()._new_session_args()
-        args['renewal_id'] = uuid.UUID(bytes=os.urandom(16))
-        args['renewed'] = now
-        args['renewal_tried'] = now
+        args.update(self._new_renewal_args(self._now()))
         return args
 
+    def _new_renewal_args(self, now):
+        return {
+            'renewal_id': uuid.UUID(bytes=os.urandom(16)),
+            'renewed': now,
+            'renewal_tried': now,
+        }
+
     def _renewal(self):
-        """ Run procedures to implement renewal timeout policy. """
+        """ Run procedures to implement renewal timeout policy. Return the
+        renewal step taken: 'started', 'retried', 'finished' or None. """
         if self.settings.renewal_timeout is None:
-            return
+            return None
 
-        now = int_now()
+        now = self._now()
         s = self._session
         if now - s.renewed < self.settings.renewal_timeout:
-            return
+            return None
 
         def _try_renew(s):
             next_bytes = os.urandom(16)
@@ -575,8 +1356,10 @@ class _RenewalSession:
 
         if s.renewal_next is None:
             # Start renewal
-            self._logger.debug('Trying to renew session %s' % s.id)
+            if self._log_debug:
+                self._logger.debug('Trying to renew session %s', s.id)
             _try_renew(s)
+            return 'started'
         else:
             # We are in the middle of the procedure.
             if self._renewal_id == s.renewal_id:
@@ -585,21 +1368,85 @@ class _RenewalSession:
                 # to try again.
                 since_try = now - s.renewal_tried
                 if since_try > self.settings.renewal_try_every:
-                    self._logger.debug(
-                        "Renewal try timed out. Trying again"
-                        " to renew session %s"
-                        % s.id
-                    )
+                    if self._log_debug:
+                        self._logger.debug(
+                            "Renewal try timed out. Trying again"
+                            " to renew session %s", s.id
+                        )
                     _try_renew(s)
+                    return 'retried'
             else:
-                self._logger.debug(
-                    "Received ack of the new renewal id."
-                    " Finishing renewal of session %s" % s.id
-                )
+                if self._log_debug:
+                    self._logger.debug(
+                        "Received ack of the new renewal id."
+                        " Finishing renewal of session %s", s.id
+                    )
                 s.renewal_id = s.renewal_next
                 s.renewal_next = None
                 s.renewed = now
                 self._dirty = True
+                return 'finished'
+        return None
+
+
+class _HMACRenewalSession:
+    """ Session mixin deriving renewal ids from the session id and the
+    renewal epoch, so that renewal only writes the incremented epoch.
+
+    The candidate id of the next epoch is sent with every response until
+    acknowledged, instead of every ``renewal_try_every`` seconds, as sending
+    it doesn't need a write. """
+
+    def _epoch_renewal_id(self, session, epoch):
+        digest = hmac.new(
+            self._renewal_key,
+            session.id.bytes + struct.pack('>Q', epoch),
+            hashlib.sha256,
+        ).digest()
+        return uuid.UUID(bytes=digest[:16])
+
+    def _is_known_renewal_id(self, session):
+        # Ids of the next epoch are issued only when renewal is due, and
+        # can't be derived without the key.
+        epoch = session.renewal_epoch
+        return self._renewal_id in (
+            self._epoch_renewal_id(session, epoch),
+            self._epoch_renewal_id(session, epoch + 1),
+        )
+
+    def _current_renewal_id(self, session):
+        return self._epoch_renewal_id(session, session.renewal_epoch)
+
+    def _new_renewal_args(self, now):
+        return {
+            'renewed': now,
+            'renewal_epoch': 0,
+        }
+
+    def _renewal(self):
+        if self.settings.renewal_timeout is None:
+            return None
+
+        s = self._session
+        next_id = self._epoch_renewal_id(s, s.renewal_epoch + 1)
+        if self._renewal_id == next_id:
+            if self._log_debug:
+                self._logger.debug(
+                    "Received ack of the new renewal id."
+                    " Finishing renewal of session %s", s.id
+                )
+            s.renewal_epoch += 1
+            s.renewed = self._now()
+            self._dirty = True
+            return 'finished'
+
+        if self._now() - s.renewed < self.settings.renewal_timeout:
+            return None
+        if self._log_debug:
+            self._logger.debug('Trying to renew session %s', s.id)
+        self._cookieval = s.id.bytes + next_id.bytes
+        self._attach_after_commit()
+        return 'started'
 
 
 class _IdleSession:
@@ -633,17 +1480,18 @@ class _IdleSession:
                 " timestamp value is None: %s." % session.id
             )
 
-        if int_now() > session.idle_expire:
-            self._logger.info(
-                'Session has reached idle timeout: %s.' % session.id
-            )
+        if self._now() > session.idle_expire:
+            if self._log_info:
+                self._logger.info(
+                    'Session has reached idle timeout: %s.', session.id
+                )
             return False
         return True
 
     def _new_session_args(self):
         args = super()._new_session_args()
         if self._idle_timeout is not None:
-            args['idle_expire'] = int_now() + self._idle_timeout
+            args['idle_expire'] = self._now() + self._idle_timeout
         return args
 
     def _maybe_extend(self):
@@ -654,20 +1502,45 @@ class _IdleSession:
 
         s = self._session
         accessed = s.idle_expire - self.settings.idle_timeout
-        since_access = int_now() - accessed
+        since_access = self._now() - accessed
         past_delay = (self.settings.extension_delay is None or
                       since_access > self.settings.extension_delay)
         if past_delay:
-            force_update = (since_access > self.settings.extension_deadline or
-                            weighted_truth(self.settings.extension_chance))
-            if force_update:
-                self._logger.debug(
-                    "Forcing update of 'idle_expire' column for"
-                    " otherwise clean session %s" % s.id
+            if self._extension_bucket is None:
+                force_update = (
+                    since_access > self.settings.extension_deadline or
+                    weighted_truth(self.settings.extension_chance)
                 )
+            else:
+                force_update = self._hashed_extension_due(s, accessed)
+            if force_update:
+                if self._log_debug:
+                    self._logger.debug(
+                        "Forcing update of 'idle_expire' column for"
+                        " otherwise clean session %s", s.id
+                    )
                 # Marking it dirty will trigger the extension.
                 self._dirty = True
 
+    def _hashed_extension_due(self, session, accessed):
+        """ Return True if the session has reached its extension slot in the
+        current time bucket, and hasn't been extended since. Slots are
+        derived from the session id and the bucket, so that extensions of
+        all sessions spread evenly over the bucket. """
+        bucket_size = self._extension_bucket
+        now = self._now()
+        bucket = now // bucket_size
+        start = bucket * bucket_size
+        # The slot of the next bucket may be up to its end, extend now if
+        # the session would expire before, e.g. when the idle timeout has
+        # been changed at runtime.
+        if accessed + self.settings.idle_timeout < start + 2 * bucket_size:
+            return True
+        if accessed >= start:
+            return False
+        slot = zlib.crc32(session.id.bytes + struct.pack('>Q', bucket))
+        return now >= start + slot % bucket_size
+
 
 class _AbsoluteSession:
     """ Session mixin to implement Absolute Timeout security policy. """
@@ -690,10 +1563,13 @@ class _AbsoluteSession:
         if absolute_timeout is None:
             return True
 
-        if int_now() > session.absolute_expire:
-            self._logger.info(
-                'Session has reached absolute timeout: %s.' % session.id
-            )
+        # Same as absolute_expire of configurable sessions, but doesn't
+        # need the model class to know the timeout.
+        if self._now() > session.created + absolute_timeout:
+            if self._log_info:
+                self._logger.info(
+                    'Session has reached absolute timeout: %s.', session.id
+                )
             return False
         return True
 
@@ -740,7 +1616,7 @@ class _ConfigAbsoluteSession(_AbsoluteSession):
     def _new_session_args(self):
         args = super()._new_session_args()
         if self._absolute_timeout is not None:
-            args['absolute_expire'] = int_now() + self._absolute_timeout
+            args['absolute_expire'] = self._now() + self._absolute_timeout
         return args
 
     def _settings_mixins(self):
@@ -761,3 +1637,166 @@ class _ConfigRenewalSession(_RenewalSession):
         mixins = super()._settings_mixins()
         mixins.append(_ConfigRenewalSettings)
         return mixins
+
+
+class _BreakerSession:
+    """ Session mixin reporting DB operations to the circuit breaker, and
+    serving empty sessions which are never persisted while it's open. """
+    _degraded = False
+    # Duration of the load of a row prefetched by the prefetch tween.
+    _prefetch_duration = 0
+
+    def _init_request_session(self):
+        if self._circuit_breaker.allow():
+            super()._init_request_session()
+            return
+        if self._log_debug:
+            self._logger.debug('Circuit breaker is open, degrading session')
+        # Changes are kept for the request only: TM hooks are not attached,
+        # so nothing is written and the session cookie is left untouched.
+        self._degraded = True
+        self._init_session_instance()
+        self._add_vary_callback()
+
+    def _breaker_record(self, start, exception=None):
+        transition = self._circuit_breaker.record(
+            perf_counter() - start,
+            exception,
+        )
+        if transition == 'opened':
+            self._logger.warning('Session circuit breaker opened.')
+            self._fire_event(BreakerOpenedEvent, exception)
+        elif transition == 'closed':
+            self._logger.warning('Session circuit breaker closed.')
+            self._fire_event(BreakerClosedEvent)
+
+    def _load_session(self, id):
+        start = perf_counter()
+        try:
+            session = super()._load_session(id)
+        except SQLAlchemyError as exc:
+            self._breaker_record(start, exc)
+            raise
+        # Prefetched rows were loaded before, in a thread of the tween.
+        self._breaker_record(start - self._prefetch_duration)
+        return session
+
+    def _tm_before_commit(self):
+        start = perf_counter()
+        try:
+            super()._tm_before_commit()
+            # Measure the session writes too, instead of leaving them to the
+            # commit.
+            self._flush_session()
+        except SQLAlchemyError as exc:
+            self._breaker_record(start, exc)
+            raise
+        self._breaker_record(start)
+
+
+class _MetricsSession:
+    """ Session mixin reporting timings and outcomes of the session
+    lifecycle phases to the metrics sink. """
+    def _emit(self, name, duration=None, outcome=None):
+        self._metrics(self.request, name, duration, outcome)
+
+    def _unpack_cookie(self, cookie_raw):
+        start = perf_counter()
+        outcome = 'invalid'
+        try:
+            unpacked = super()._unpack_cookie(cookie_raw)
+            outcome = 'valid'
+            return unpacked
+        except CookieCryptoError:
+            outcome = 'crypto_error'
+            raise
+        finally:
+            self._emit('cookie_load', perf_counter() - start, outcome)
+
+    def _pack_cookie(self, value):
+        start = perf_counter()
+        packed = super()._pack_cookie(value)
+        self._emit('cookie_dump', perf_counter() - start)
+        return packed
+
+    def _init_request_session(self):
+        start = perf_counter()
+        super()._init_request_session()
+        outcome = 'new' if self._new else 'existing'
+        self._emit('init', perf_counter() - start, outcome)
+
+    def _load_session(self, id):
+        start = perf_counter()
+        session = super()._load_session(id)
+        outcome = 'miss' if session is None else 'hit'
+        self._emit('load', perf_counter() - start, outcome)
+        return session
+
+    def _is_valid_session(self, session):
+        start = perf_counter()
+        valid = super()._is_valid_session(session)
+        outcome = 'valid' if valid else 'invalid'
+        self._emit('validate', perf_counter() - start, outcome)
+        return valid
+
+    def _tm_before_commit(self):
+        start = perf_counter()
+        super()._tm_before_commit()
+        if not self._dirty:
+            outcome = 'clean'
+        elif self._new:
+            outcome = 'created'
+        else:
+            outcome = 'saved'
+        self._emit('before_commit', perf_counter() - start, outcome)
+
+    def _tm_after_commit(self, status):
+        start = perf_counter()
+        super()._tm_after_commit(status)
+        outcome = 'committed' if status else 'aborted'
+        self._emit('after_commit', perf_counter() - start, outcome)
+
+    def _renewal(self):
+        outcome = super()._renewal()
+        if outcome is not None:
+            self._emit('renewal', outcome=outcome)
+        return outcome
+
+    def _maybe_extend(self):
+        dirty = self._dirty
+        super()._maybe_extend()
+        if self._dirty and not dirty:
+            self._emit('extension', outcome='extended')
+
+    @initializes_session
+    def invalidate(self):
+        super().invalidate()
+        self._emit('invalidate', outcome='invalidated')
+
+
+class _ProfiledSession:
+    """ Session mixin running the session work of a sampled fraction of
+    requests under the profiler. Application code running between the
+    session phases is not profiled. """
+    def __init__(self, request):
+        super().__init__(request)
+        self._sampled = probable_truth(self._profile_chance)
+        self._profiling = False
+
+    def _profiled_call(self, func, *args):
+        if not self._sampled or self._profiling:
+            return func(*args)
+        self._profiling = True
+        try:
+            return self._profiler.run(func, *args)
+        finally:
+            self._profiling = False
+
+    def _init_request_session(self):
+        self._profiled_call(super()._init_request_session)
+
+    def _tm_before_commit(self):
+        self._profiled_call(super()._tm_before_commit)
+
+    def _tm_after_commit(self, status):
+        self._profiled_call(super()._tm_after_commit, status)
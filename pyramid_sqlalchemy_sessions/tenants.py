@@ -0,0 +1,59 @@
+from pyramid.interfaces import ISessionFactory
+from zope.interface import implementer
+
+from .config import factory_args_from_settings
+from .session import get_session_factory
+
+
+@implementer(ISessionFactory)
+class SessionFactoryRegistry():
+    """
+    :term:`Session factory` delegating to the factory of the tenant of the
+    request, so that tenants with different settings, model classes or
+    tables can be served by the same processes, sharing their connection
+    pools.
+
+    Factories keep their settings to themselves, so the same model class
+    may also be used by tenants with different settings.
+
+    Arguments:
+
+    tenant_resolver
+        callable returning the tenant name of a request (**required**),
+        e.g. ``lambda request: request.host``. When used with the prefetch
+        tween, it's also called before the request is routed, so it must
+        not depend on routing, e.g. on ``request.matchdict``.
+    default
+        name of the tenant used for requests of unknown tenants. If not
+        provided, such requests raise :exc:`KeyError`.
+    """
+    def __init__(self, tenant_resolver, default=None):
+        self.tenant_resolver = tenant_resolver
+        self.default = default
+        self.factories = {}
+
+    def add(self, tenant, factory):
+        """ Register the session factory of the tenant. """
+        self.factories[tenant] = factory
+
+    def add_from_settings(self, tenant, settings, maybe_dotted, prefix):
+        """ Create the session factory of the tenant from the settings with
+        the prefix, e.g. ``session.tenant_name.``, and register it. See
+        :func:`.factory_args_from_settings` for arguments. """
+        args = factory_args_from_settings(settings, maybe_dotted, prefix)
+        factory = get_session_factory(**args)
+        self.add(tenant, factory)
+        return factory
+
+    def get_factory(self, request):
+        """ Return the session factory of the tenant of the request. """
+        tenant = self.tenant_resolver(request)
+        try:
+            return self.factories[tenant]
+        except KeyError:
+            if self.default is None:
+                raise KeyError('No session factory for tenant: %r' % tenant)
+            return self.factories[self.default]
+
+    def __call__(self, request):
+        return self.get_factory(request)(request)
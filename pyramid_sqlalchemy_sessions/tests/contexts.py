@@ -22,11 +22,11 @@ class new_context():
         self,
         settings,
         set_time=None,
-        isolation_level=None
+        isolation_level=None,
+        url='sqlite://',
     ):
         import pyramid_sqlalchemy_sessions.session as session_module
         self._sm = session_module
-        url = 'sqlite://'
         kwargs = {}
         if isolation_level is not None:
             kwargs['isolation_level'] = isolation_level
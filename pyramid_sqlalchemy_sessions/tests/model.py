@@ -1,6 +1,14 @@
 from sqlalchemy.ext.declarative import declarative_base
 
-from ..model import BaseMixin
+from ..model import (
+    AbsoluteMixin,
+    BaseMixin,
+    HMACRenewalMixin,
+    IdleMixin,
+    IndexedUseridMixin,
+    KeyValueDataMixin,
+    PartitionedMixin,
+)
 
 
 Base = declarative_base()
@@ -12,3 +20,29 @@ class DummySessionModel(BaseMixin, Base):
 
 class FailingSessionModel:
     pass
+
+
+class IdleSessionModel(IdleMixin, BaseMixin, Base):
+    __tablename__ = 'test_idle_session'
+
+
+class HMACRenewalSessionModel(HMACRenewalMixin, BaseMixin, Base):
+    __tablename__ = 'test_hmac_renewal_session'
+
+
+class AbsoluteSessionModel(AbsoluteMixin, BaseMixin, Base):
+    __tablename__ = 'test_absolute_session'
+
+
+class UserSessionModel(IndexedUseridMixin, KeyValueDataMixin, BaseMixin, Base):
+    __tablename__ = 'test_user_session'
+
+
+class PartitionedSessionModel(
+    PartitionedMixin,
+    IdleMixin,
+    AbsoluteMixin,
+    BaseMixin,
+    Base,
+):
+    __tablename__ = 'test_partitioned_session'
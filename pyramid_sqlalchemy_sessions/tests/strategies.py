@@ -6,6 +6,7 @@ import collections.abc
 import hypothesis.strategies as st
 
 from ..config import (
+    FLASH_STORAGES,
     RUNTIME_SETTINGS,
     SECRET_SIZES,
 )
@@ -78,6 +79,14 @@ def shared_config(draw):
             st.booleans(),
             key='enable_configcookie'
             )),
+        'enable_version': draw(st.shared(
+            st.booleans(),
+            key='enable_version'
+            )),
+        'enable_keyvalue': draw(st.shared(
+            st.booleans(),
+            key='enable_keyvalue'
+            )),
         'config_renewal': draw(st.shared(
             st.sampled_from([None] + [True, False] * 3),
             key='config_renewal'
@@ -151,6 +160,8 @@ def valid_model_class(draw):
         ConfigIdleMixin,
         ConfigAbsoluteMixin,
         ConfigRenewalMixin,
+        VersionMixin,
+        KeyValueDataMixin,
         )
     Base = declarative_base()
     bases = [Base, BaseMixin]
@@ -161,6 +172,10 @@ def valid_model_class(draw):
         bases.append(CSRFMixin)
     if shared['enable_configcookie']:
         bases.append(ConfigCookieMixin)
+    if shared['enable_version']:
+        bases.append(VersionMixin)
+    if shared['enable_keyvalue']:
+        bases.append(KeyValueDataMixin)
 
     runtime_mixins = (
         ('config_renewal', ConfigRenewalMixin, RenewalMixin),
@@ -201,6 +216,23 @@ def valid_settings(draw):
         'cookie_secure': draw(st.booleans()),
         'cookie_httponly': draw(st.booleans()),
         'renewal_try_every': draw(st.integers(min_value=1, max_value=MAX_SMALLINT)),
+        'extension_bucket': None,
+        'core_persistence': draw(st.booleans()),
+        'statement_cache': draw(st.booleans()),
+        'conflict_resolver': None,
+        'flash_storage': draw(st.sampled_from(FLASH_STORAGES)),
+        'flash_cache': None,
+        'metrics': None,
+        'clock': None,
+        'profile': None,
+        'profile_chance': 0.01,
+        'profile_file': None,
+        'profile_interval': 60,
+        'partition_key': None,
+        'partition_interval': 604800,
+        'persistence_engine': None,
+        'circuit_breaker': None,
+        'persistence_mode': 'tm',
     }
     shared = draw(shared_config())
     settings.update(draw(
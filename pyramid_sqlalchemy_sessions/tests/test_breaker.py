@@ -0,0 +1,133 @@
+import pytest
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+class Clock():
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def test_CircuitBreaker():
+    from ..breaker import CircuitBreaker
+    clock = Clock()
+    breaker = CircuitBreaker(failures=2, latency=1, recovery=30, clock=clock)
+    assert breaker.record(0.1) is None
+    assert breaker.record(2) is None
+    assert breaker.record(0.1) is None
+    assert breaker.record(2) is None
+    assert breaker.record(0, Exception()) == 'opened'
+    assert breaker.open
+    assert not breaker.allow()
+    clock.time = 30
+    # A single trial request.
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert breaker.record(2) is None
+    clock.time = 59
+    assert not breaker.allow()
+    clock.time = 60
+    assert breaker.allow()
+    assert breaker.record(0.1) == 'closed'
+    assert not breaker.open
+    assert breaker.allow()
+
+
+def test_breaker_session(minimal_settings):
+    from ..breaker import CircuitBreaker
+    from ..events import (
+        BreakerClosedEvent,
+        BreakerOpenedEvent,
+    )
+    clock = Clock()
+    breaker = CircuitBreaker(failures=2, latency=-1, recovery=30, clock=clock)
+    settings = dict(minimal_settings, circuit_breaker=breaker)
+    events = []
+    with new_context(settings) as context:
+        for event_class in (BreakerOpenedEvent, BreakerClosedEvent):
+            context.config.add_subscriber(events.append, event_class)
+        # Every operation is slow: the commit hook and the load.
+        with new_request(context) as request:
+            request.session['test'] = 1
+            id = request.session._session.id
+        with new_request(context) as request:
+            assert request.session['test'] == 1
+        assert [type(e) for e in events] == [BreakerOpenedEvent]
+        cookies = context.cookies
+        with new_request(context) as request:
+            assert request.session.new
+            assert 'test' not in request.session
+            request.session['test'] = 2
+        assert context.cookies == cookies
+        breaker.latency = 1
+        clock.time = 30
+        with new_request(context) as request:
+            assert request.session['test'] == 1
+            assert request.session._session.id == id
+        assert [type(e) for e in events] == [
+            BreakerOpenedEvent,
+            BreakerClosedEvent,
+        ]
+
+
+@pytest.mark.parametrize('core_persistence', [False, True])
+def test_breaker_writes(minimal_settings, core_persistence):
+    from sqlalchemy import event
+    from sqlalchemy.exc import OperationalError
+    from ..breaker import CircuitBreaker
+    breaker = CircuitBreaker(failures=1)
+    settings = dict(minimal_settings, **{
+        'circuit_breaker': breaker,
+        'core_persistence': core_persistence,
+    })
+
+    def fail_inserts(conn, cursor, statement, *args):
+        if statement.startswith('INSERT'):
+            raise OperationalError(statement, {}, Exception('Overloaded'))
+
+    with new_context(settings) as context:
+        event.listen(context.engine, 'before_cursor_execute', fail_inserts)
+        # Failed writes of the ORM reach the breaker too.
+        with pytest.raises(OperationalError):
+            with new_request(context) as request:
+                request.session['test'] = 1
+        assert breaker.open
+        # Degraded sessions accept changes, but don't persist them.
+        with new_request(context) as request:
+            request.session['test'] = 1
+            assert request.session._degraded
+        assert context.cookies == {}
+
+
+def test_breaker_app_errors(minimal_settings):
+    from sqlalchemy import (
+        Column,
+        Integer,
+    )
+    from sqlalchemy.exc import IntegrityError
+    from sqlalchemy.ext.declarative import declarative_base
+    from ..breaker import CircuitBreaker
+    Base = declarative_base()
+
+    class Item(Base):
+        __tablename__ = 'items'
+        id = Column(Integer, primary_key=True)
+
+    breaker = CircuitBreaker(failures=1)
+    settings = dict(minimal_settings, circuit_breaker=breaker)
+    with new_context(settings) as context:
+        Base.metadata.create_all(context.engine)
+        with new_request(context) as request:
+            request.dbsession.add(Item(id=1))
+        # Errors of app models don't count as session DB failures.
+        with pytest.raises(IntegrityError):
+            with new_request(context) as request:
+                request.session['test'] = 1
+                request.dbsession.add(Item(id=1))
+        assert not breaker.open
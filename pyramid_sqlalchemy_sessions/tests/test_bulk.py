@@ -0,0 +1,160 @@
+import pytest
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+@pytest.fixture
+def user_settings(minimal_settings):
+    from .model import UserSessionModel
+    return dict(minimal_settings, model_class=UserSessionModel)
+
+
+def create_sessions(context, userids):
+    ids = []
+    for userid in userids:
+        context._cookies = {}
+        with new_request(context) as request:
+            request.session['test'] = 1
+            request.session.userid = userid
+            ids.append(request.session._session.id)
+    return ids
+
+
+def test_list_user_sessions(user_settings):
+    from ..bulk import list_user_sessions
+    from .model import UserSessionModel
+    with new_context(user_settings) as context:
+        ids = create_sessions(context, [1, 2, 1])
+        with new_request(context) as request:
+            dbsession = request.dbsession
+            sessions = list_user_sessions(dbsession, UserSessionModel, 1)
+            assert {s.id for s in sessions} == {ids[0], ids[2]}
+            assert list_user_sessions(dbsession, UserSessionModel, 3) == []
+
+
+def test_invalidate_user_sessions(user_settings):
+    from ..bulk import invalidate_user_sessions
+    from .model import UserSessionModel
+    data_table = UserSessionModel.data_table
+    with new_context(user_settings) as context:
+        ids = create_sessions(context, [1, 2, 1, 1])
+        # Keep the session of the current request.
+        with new_request(context) as request:
+            request.session['test'] = 2
+            deleted = invalidate_user_sessions(
+                request.dbsession,
+                UserSessionModel,
+                1,
+                keep=request.session,
+                tm=request.tm,
+            )
+            assert deleted == 2
+        with new_request(context) as request:
+            assert request.session['test'] == 2
+            assert request.session._session.id == ids[3]
+            remaining = request.dbsession.query(UserSessionModel.id).all()
+            assert {row.id for row in remaining} == {ids[1], ids[3]}
+            data_ids = request.dbsession.execute(
+                data_table.select()
+            ).fetchall()
+            assert {row.session_id for row in data_ids} == {ids[1], ids[3]}
+        # Rolled back invalidation keeps the sessions.
+        request = new_request(context)
+        with pytest.raises(ZeroDivisionError):
+            with request.tm:
+                invalidate_user_sessions(
+                    request.dbsession,
+                    UserSessionModel,
+                    2,
+                    tm=request.tm,
+                )
+                1 / 0
+        request = new_request(context)
+        with request.tm:
+            assert invalidate_user_sessions(
+                request.dbsession,
+                UserSessionModel,
+                2,
+                tm=request.tm,
+            ) == 1
+
+
+def test_requires_userid(minimal_settings):
+    from ..bulk import (
+        invalidate_user_sessions,
+        list_user_sessions,
+    )
+    from ..exceptions import ConfigurationError
+    from .model import DummySessionModel
+    with new_context(minimal_settings) as context:
+        with new_request(context) as request:
+            for func in (invalidate_user_sessions, list_user_sessions):
+                with pytest.raises(ConfigurationError):
+                    func(request.dbsession, DummySessionModel, 1)
+
+
+def test_GCCommand_invalidate_users(user_settings, capsys):
+    from ..gc import GCCommand
+    from .model import UserSessionModel
+    with new_context(user_settings) as context:
+        create_sessions(context, [1, 2, 1])
+        request = new_request(context)
+        GCCommand.invalidate_users(
+            [1, 3],
+            request.dbsession,
+            {'model_class': UserSessionModel},
+            request.tm,
+        )
+        out = capsys.readouterr().out
+        assert 'Invalidated 2 sessions of user 1' in out
+        assert 'Invalidated 0 sessions of user 3' in out
+        with new_request(context) as request:
+            assert request.dbsession.query(UserSessionModel).count() == 1
+
+
+@pytest.mark.parametrize('model', ['DummySessionModel', 'UserSessionModel'])
+def test_iter_sessions(minimal_settings, model):
+    from ..bulk import (
+        iter_sessions,
+        load_many,
+    )
+    from . import model as model_module
+    model_class = getattr(model_module, model)
+    settings = dict(minimal_settings, model_class=model_class)
+    with new_context(settings) as context:
+        ids = []
+        for i in range(7):
+            context._cookies = {}
+            with new_request(context) as request:
+                request.session['test'] = i
+                if i % 2:
+                    request.session['odd'] = True
+                ids.append(request.session._session.id)
+        with new_request(context) as request:
+            dbsession = request.dbsession
+            rows = list(iter_sessions(dbsession, model_class, batch_size=3))
+            assert [row.id for row in rows] == sorted(ids)
+            odd = {row.id for row in rows if 'odd' in row.data}
+            assert odd == set(ids[1::2])
+            rows = iter_sessions(
+                dbsession,
+                model_class,
+                model_class.id.in_(ids[:4]),
+                batch_size=2,
+            )
+            assert [row.id for row in rows] == sorted(ids[:4])
+            assert list(iter_sessions(
+                dbsession,
+                model_class,
+                model_class.id.in_([]),
+            )) == []
+            loaded = load_many(dbsession, model_class, ids[:2] + [ids[5]])
+            assert set(loaded) == {ids[0], ids[1], ids[5]}
+            assert loaded[ids[5]].data['test'] == 5
+            assert loaded[ids[0]].created == context.time
+            with pytest.raises(AttributeError):
+                loaded[ids[0]].missing
+            assert load_many(dbsession, model_class, []) == {}
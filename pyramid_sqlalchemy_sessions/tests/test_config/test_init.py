@@ -37,6 +37,23 @@ def test_defaults_exist():
         'extension_delay',
         'extension_chance',
         'extension_deadline',
+        'extension_bucket',
+        'core_persistence',
+        'statement_cache',
+        'conflict_resolver',
+        'flash_storage',
+        'flash_cache',
+        'metrics',
+        'clock',
+        'profile',
+        'profile_chance',
+        'profile_file',
+        'profile_interval',
+        'partition_key',
+        'partition_interval',
+        'persistence_engine',
+        'circuit_breaker',
+        'persistence_mode',
     }
     assert set(settings.keys()) == defaults_names
 
@@ -1,3 +1,7 @@
+import os
+import tempfile
+import uuid
+
 import pytest
 
 from hypothesis import (
@@ -5,6 +9,10 @@ from hypothesis import (
     given,
 )
 import hypothesis.strategies as st
+from sqlalchemy import (
+    func,
+    select,
+)
 
 from .contexts import (
     new_context,
@@ -118,6 +126,70 @@ def test_GCCommand_runs_Cleaner(
     assert cleaner_cls == settings_cls
 
 
+def test_GCCommand_light(monkeypatch, minimal_settings):
+    from sqlalchemy import create_engine
+    from ..gc import GCCommand
+    from .model import IdleSessionModel
+    # Note: tmpdir fixture doesn't work with the request fixture above.
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url = 'sqlite:///%s' % os.path.join(tmpdir, 'sessions.db')
+        engine = create_engine(url)
+        IdleSessionModel.metadata.create_all(engine)
+        engine.execute(IdleSessionModel.__table__.insert(), [
+            {'id': uuid.uuid4(), 'created': 0, 'idle_expire': 0},
+            {'id': uuid.uuid4(), 'created': 0, 'idle_expire': 2 ** 31 - 1},
+        ])
+        config_uri = os.path.join(tmpdir, 'app.ini')
+        with open(config_uri, 'w') as f:
+            f.write('\n'.join([
+                '[app:main]',
+                # Not loaded in the light mode.
+                'use = egg:nonexistent_app',
+                'db.url = %s' % url,
+                'session.model_class = %s.model.IdleSessionModel'
+                % __package__,
+                'session.secret_key = %s' % minimal_settings['secret_key'],
+                'session.idle_timeout = 300',
+                'session.statement_cache = false',
+            ]))
+        monkeypatch.setattr(
+            'pyramid_sqlalchemy_sessions.gc.setup_logging',
+            lambda config_uri: None,
+        )
+        command = GCCommand([
+            'pyramid_session_gc', config_uri, '--light',
+            '--engine-prefix', 'db.',
+        ], 'session.')
+        assert command.run() == 0
+        table = IdleSessionModel.__table__
+        count = engine.execute(select([func.count()]).select_from(table))
+        assert count.scalar() == 1
+        engine.dispose()
+
+
+def test_Cleaner_statement_cache(minimal_settings):
+    from ..core import get_statements
+    from ..gc import Cleaner
+    from .model import IdleSessionModel
+    settings = minimal_settings.copy()
+    settings.update({
+        'model_class': IdleSessionModel,
+        'statement_cache': True,
+        'idle_timeout': 300,
+        'absolute_timeout': None,
+    })
+    statements = get_statements(IdleSessionModel)
+    with new_context(settings) as context:
+        for i in range(3):
+            request = new_request(context)
+            with request.tm:
+                assert Cleaner.delete_query(request.dbsession, settings)
+            if i == 0:
+                compiled = len(statements.compiled_cache)
+    assert len(statements._expired_deletes) == 1
+    assert len(statements.compiled_cache) == compiled == 1
+
+
 @given(settings=valid_settings(), shared=shared_config())
 def test_Cleaner(monkeypatch, settings, shared):
     cls = settings['model_class']
@@ -136,7 +208,15 @@ def test_Cleaner(monkeypatch, settings, shared):
 
     def session_exists(id, context):
         with new_request(context) as request:
-            return request.dbsession.query(cls).get(id) != None
+            exists = request.dbsession.query(cls).get(id) != None
+            data_table = getattr(cls, 'data_table', None)
+            if data_table is not None:
+                # Data rows are removed together with the session.
+                rows = request.dbsession.execute(data_table.select().where(
+                    data_table.c.session_id == id
+                )).fetchall()
+                assert bool(rows) == exists
+            return exists
 
     def clean(context, shared):
         from ..gc import Cleaner
@@ -1,3 +1,7 @@
+import subprocess
+import sys
+
+import pytest
 from pyramid.interfaces import ISessionFactory
 
 from .. import includeme
@@ -8,3 +12,31 @@ def test_includeme(minimal_context):
     includeme(config)
     factory = config.registry.queryUtility(ISessionFactory)
     assert factory._model_class == minimal_context.settings['model_class']
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="Needs -X importtime")
+def test_import_time():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import pyramid_sqlalchemy_sessions'],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    imported = {
+        line.split('|')[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith('import time:')
+    }
+    assert 'pyramid_sqlalchemy_sessions' in imported
+    # Imported on use only.
+    lazy = {
+        'Cryptodome.Cipher.AES',
+        'sqlalchemy.dialects.postgresql',
+        'pyramid.paster',
+        'pyramid_sqlalchemy_sessions.gc',
+        'cProfile',
+        'pstats',
+        'tracemalloc',
+    }
+    assert not imported & lazy
@@ -0,0 +1,100 @@
+import threading
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+def test_Counter_threads():
+    from ..metrics import Counter
+    counter = Counter('test_total', 'Test.', ('kind',))
+
+    def work():
+        for i in range(1000):
+            counter.inc(labels=('a',))
+        counter.inc(2, ('b',))
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.values() == {('a',): 4000, ('b',): 8}
+    assert len(counter._shards) == 4
+
+
+def test_Histogram_render():
+    from ..metrics import Histogram
+    histogram = Histogram('test_seconds', 'Test.', ('phase',), (.1, 1))
+    histogram.observe(.05, ('load',))
+    histogram.observe(.5, ('load',))
+    histogram.observe(5, ('load',))
+    assert histogram.render().split('\n') == [
+        '# HELP test_seconds Test.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{phase="load",le="0.1"} 1',
+        'test_seconds_bucket{phase="load",le="1"} 2',
+        'test_seconds_bucket{phase="load",le="+Inf"} 3',
+        'test_seconds_sum{phase="load"} 5.55',
+        'test_seconds_count{phase="load"} 3',
+    ]
+
+
+def test_SessionMetrics(minimal_settings):
+    from ..metrics import SessionMetrics
+    metrics = SessionMetrics()
+    settings = dict(minimal_settings, metrics=metrics)
+    with new_context(settings) as context:
+        metrics.subscribe(context.config)
+        with new_request(context) as request:
+            request.session['test'] = 1
+        with new_request(context) as request:
+            request.session['test'] = 2
+        with new_request(context) as request:
+            request.session.invalidate()
+        context.set_cookie(
+            settings.get('cookie_name', 'session'), '/', None,
+            'garbage', None, False, False,
+        )
+        with new_request(context) as request:
+            assert request.session.new
+    assert metrics.created.values() == {(): 1}
+    assert metrics.saved.values() == {(): 1}
+    assert metrics.invalidated.values() == {(): 1}
+    assert metrics.loads.values() == {('hit',): 2}
+    assert metrics.cookie_errors.values() == {('invalid',): 1}
+    phases = metrics.phases.values()
+    assert phases[('before_commit',)][0][-1] == 0
+    assert sum(phases[('init',)][0]) == 4
+    text = metrics.render()
+    assert 'pyramid_session_created_total 1\n' in text
+    assert 'pyramid_session_cookie_errors_total{reason="invalid"} 1\n' in text
+    assert '# TYPE pyramid_session_phase_seconds histogram\n' in text
+
+
+def test_Cleaner_metrics(monkeypatch, minimal_settings):
+    from ..gc import Cleaner
+    from ..metrics import SessionMetrics
+    from .model import IdleSessionModel
+    metrics = SessionMetrics(namespace='test')
+    settings = dict(minimal_settings, **{
+        'model_class': IdleSessionModel,
+        'statement_cache': False,
+        'idle_timeout': 300,
+        'absolute_timeout': None,
+    })
+    with new_context(settings) as context:
+        for i in range(3):
+            context._cookies = {}
+            with new_request(context) as request:
+                request.session['test'] = 1
+        monkeypatch.setattr(
+            'pyramid_sqlalchemy_sessions.gc.int_now',
+            lambda: context.time + 301,
+        )
+        request = new_request(context)
+        cleaner_settings = dict(settings, metrics=metrics)
+        Cleaner(request.dbsession, cleaner_settings, request.tm).clean()
+    assert metrics.gc_runs.values() == {(): 1}
+    assert metrics.gc_deleted.values() == {(): 3}
+    assert 'test_gc_last_deleted_rows 3\n' in metrics.render()
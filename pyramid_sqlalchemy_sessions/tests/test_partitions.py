@@ -0,0 +1,114 @@
+import uuid
+
+import pytest
+from sqlalchemy import (
+    func,
+    select,
+)
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+def count(table):
+    return select([func.count()]).select_from(table)
+
+
+@pytest.fixture
+def partitioned_settings(minimal_settings):
+    from .model import PartitionedSessionModel
+    return dict(minimal_settings, **{
+        'model_class': PartitionedSessionModel,
+        'partition_key': 'created',
+        'partition_interval': 100,
+        'idle_timeout': 300,
+        'absolute_timeout': 1000,
+    })
+
+
+def test_PartitionScheme():
+    from ..partitions import PartitionScheme
+    from .model import PartitionedSessionModel
+    table = PartitionedSessionModel.__table__
+    scheme = PartitionScheme(table, 'created', 100)
+    assert scheme.name(scheme.start(1234)) == 'test_partitioned_session_p1200'
+    assert scheme.parse('test_partitioned_session_p1200') == 1200
+    assert scheme.parse('test_partitioned_session_default') is None
+    assert scheme.expired(1200, 2300, 1000)
+    assert not scheme.expired(1200, 2299, 1000)
+    assert list(scheme.needed(1234, 1000)) == [1200, 1300]
+    scheme = PartitionScheme(table, 'absolute_expire', 100)
+    assert scheme.expired(1200, 1300, 1000)
+    assert list(scheme.needed(1234, 200)) == [1200, 1300, 1400, 1500]
+
+
+def test_PartitionedMixin_ddl():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateTable
+    from .model import PartitionedSessionModel
+    table = PartitionedSessionModel.__table__
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert 'PRIMARY KEY' not in ddl
+    assert ddl.strip().endswith('PARTITION BY RANGE (created)')
+
+
+@pytest.mark.parametrize('changes', [
+    {'partition_key': None},
+    {'absolute_timeout': None},
+    {'partition_key': 'absolute_expire'},
+])
+def test_partition_settings_failure(partitioned_settings, changes):
+    from ..config import _process_factory_args
+    from ..config import get_config_defaults
+    from ..exceptions import ConfigurationError
+    settings = dict(get_config_defaults(), **partitioned_settings)
+    settings.update(changes)
+    with pytest.raises(ConfigurationError):
+        _process_factory_args(settings)
+
+
+def test_Cleaner_partitions(monkeypatch, partitioned_settings):
+    from ..config import get_config_defaults
+    from ..gc import Cleaner
+    from ..partitions import get_partitions
+    from .model import PartitionedSessionModel
+    table = PartitionedSessionModel.__table__
+    with new_context(partitioned_settings) as context:
+        now = context.time
+        for i in range(2):
+            context._cookies = {}
+            with new_request(context) as request:
+                request.session['test'] = 1
+        conn = context.engine.connect()
+        partitions = get_partitions(conn, table, 'created', 100)
+        scheme = partitions.scheme
+        old = scheme.start(now) - 2000
+        recent = scheme.start(now) - 100
+        for start in (old, recent):
+            partitions.create(conn, start)
+        conn.execute(partitions.table(scheme.name(old)).insert(), [
+            {'id': uuid.uuid4(), 'created': old, 'idle_expire': old + 300},
+        ])
+        conn.execute(partitions.table(scheme.name(recent)).insert(), [
+            {'id': uuid.uuid4(), 'created': recent, 'idle_expire': now},
+            {'id': uuid.uuid4(), 'created': recent, 'idle_expire': now + 900},
+        ])
+        monkeypatch.setattr(
+            'pyramid_sqlalchemy_sessions.gc.int_now',
+            lambda: now + 301,
+        )
+        settings = dict(get_config_defaults(), **partitioned_settings)
+        with new_request(context) as request:
+            deleted = Cleaner.delete_expired(request.dbsession, settings)
+        assert deleted == 3
+        current = partitions.partitions(conn)
+        assert old not in current
+        assert set(scheme.needed(now + 301, 1000)) | {recent} == set(current)
+        assert conn.execute(count(table)).scalar() == 0
+        recent_table = partitions.table(current[recent])
+        assert conn.execute(count(recent_table)).scalar() == 1
+        for name in current.values():
+            partitions.drop(conn, name)
+        conn.close()
@@ -0,0 +1,148 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+@pytest.fixture
+def engine_url():
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    yield 'sqlite:///' + path
+    os.remove(path)
+
+
+def test_prefetch_tween(monkeypatch, minimal_settings, engine_url):
+    from pyramid.interfaces import ISessionFactory
+    from ..prefetch import prefetch_tween_factory
+    from ..session import (
+        PREFETCH_KEY,
+        _CoreSession,
+    )
+    engine = create_engine(engine_url)
+    settings = dict(minimal_settings, **{
+        'core_persistence': True,
+        'persistence_engine': engine,
+    })
+    try:
+        with new_context(settings, url=engine_url) as context:
+            with new_request(context) as request:
+                request.session['test'] = 1
+                id = request.session._session.id
+                factory = type(request.session)
+            context.config.registry.registerUtility(factory, ISessionFactory)
+            monkeypatch.setattr(
+                _CoreSession,
+                '_load_session',
+                lambda self, id: pytest.fail(),
+            )
+
+            def handler(request):
+                request.environ[PREFETCH_KEY][1].result()
+                return request.session['test']
+
+            tween = prefetch_tween_factory(handler, context.config.registry)
+            with new_request(context) as request:
+                assert tween(request) == 1
+                assert request.session._session.id == id
+                assert PREFETCH_KEY not in request.environ
+    finally:
+        engine.dispose()
+
+
+def test_prefetch_breaker(minimal_settings, engine_url):
+    import time
+    from pyramid.interfaces import ISessionFactory
+    from sqlalchemy import event
+    from ..breaker import CircuitBreaker
+    from ..prefetch import prefetch_tween_factory
+    from ..session import PREFETCH_KEY
+
+    class RecordingBreaker(CircuitBreaker):
+        def record(self, duration, exception=None):
+            durations.append(duration)
+            return super().record(duration, exception)
+
+    durations = []
+    engine = create_engine(engine_url)
+    settings = dict(minimal_settings, **{
+        'core_persistence': True,
+        'persistence_engine': engine,
+        'circuit_breaker': RecordingBreaker(),
+    })
+
+    def slow_loads(conn, cursor, statement, *args):
+        if statement.startswith('SELECT'):
+            time.sleep(0.05)
+
+    try:
+        with new_context(settings, url=engine_url) as context:
+            with new_request(context) as request:
+                request.session['test'] = 1
+                factory = type(request.session)
+            context.config.registry.registerUtility(factory, ISessionFactory)
+            event.listen(engine, 'before_cursor_execute', slow_loads)
+
+            def handler(request):
+                request.environ[PREFETCH_KEY][1].result()
+                return request.session['test']
+
+            tween = prefetch_tween_factory(handler, context.config.registry)
+            del durations[:]
+            with new_request(context) as request:
+                assert tween(request) == 1
+            # The load in the tween thread is reported.
+            assert durations[0] >= 0.05
+
+            def unused(request):
+                return None
+
+            tween = prefetch_tween_factory(unused, context.config.registry)
+            with new_request(context) as request:
+                tween(request)
+                assert PREFETCH_KEY not in request.environ
+    finally:
+        engine.dispose()
+
+
+def test_prefetch_tenant_errors(minimal_settings, engine_url):
+    from pyramid.interfaces import ISessionFactory
+    from ..prefetch import prefetch_tween_factory
+    from ..session import PREFETCH_KEY
+    from ..tenants import SessionFactoryRegistry
+    engine = create_engine(engine_url)
+    settings = dict(minimal_settings, **{
+        'core_persistence': True,
+        'persistence_engine': engine,
+    })
+
+    def resolver(request):
+        # Depends on routing, which hasn't happened in the tween.
+        return request.matchdict['tenant']
+
+    try:
+        with new_context(settings, url=engine_url) as context:
+            with new_request(context) as request:
+                request.session['test'] = 1
+                factory = type(request.session)
+            registry = SessionFactoryRegistry(resolver)
+            registry.add('a', factory)
+            context.config.registry.registerUtility(registry, ISessionFactory)
+
+            def handler(request):
+                assert PREFETCH_KEY not in request.environ
+                request.matchdict = {'tenant': 'a'}
+                return registry(request)['test']
+
+            tween = prefetch_tween_factory(handler, context.config.registry)
+            with new_request(context) as request:
+                request.matchdict = None
+                assert tween(request) == 1
+    finally:
+        engine.dispose()
@@ -0,0 +1,96 @@
+import os
+import pstats
+import tracemalloc
+
+import pytest
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+@pytest.mark.parametrize('profile', ['cprofile', 'tracemalloc'])
+def test_profiler(minimal_settings, tmpdir, profile):
+    from ..profiling import PROFILERS
+    from ..session import _ProfiledSession
+    path = str(tmpdir.join('profile-{pid}'))
+    settings = dict(minimal_settings, **{
+        'profile': profile,
+        'profile_chance': 1,
+        'profile_file': path,
+        'profile_interval': 3600,
+    })
+    tracing = tracemalloc.is_tracing()
+    with new_context(settings) as context:
+        request = new_request(context)
+        session = request.session
+        assert isinstance(session, _ProfiledSession)
+        profiler = session._profiler
+        assert isinstance(profiler, PROFILERS[profile])
+        with request:
+            session['test'] = 1
+        assert tracemalloc.is_tracing() == tracing
+        path = path.format(pid=os.getpid())
+        assert not os.path.exists(path)
+        profiler.dump()
+    assert os.path.exists(path)
+    if profile == 'cprofile':
+        stats = pstats.Stats(path)
+        names = {func[2] for func in stats.stats}
+        assert {'_init_request_session', '_tm_before_commit',
+                '_tm_after_commit'} <= names
+    else:
+        with open(path) as f:
+            lines = f.readlines()
+        assert lines[0].startswith('# 3 samples')
+
+
+def test_profiler_sampling(monkeypatch, minimal_settings):
+    from ..profiling import PROFILE_ENV
+    from ..session import _ProfiledSession
+    with new_context(minimal_settings) as context:
+        request = new_request(context)
+        assert not isinstance(request.session, _ProfiledSession)
+    monkeypatch.setenv(PROFILE_ENV, 'cprofile')
+    monkeypatch.setattr(
+        'pyramid_sqlalchemy_sessions.session.probable_truth',
+        lambda probability: False,
+    )
+    with new_context(minimal_settings) as context:
+        with new_request(context) as request:
+            session = request.session
+            assert isinstance(session, _ProfiledSession)
+            session._profiler.run = lambda *args: pytest.fail()
+            session['test'] = 1
+
+
+def test_profiler_atexit(monkeypatch, tmpdir):
+    from .. import profiling
+    hooks = []
+    monkeypatch.setattr(profiling, '_atexit_registered', False)
+    monkeypatch.setattr(profiling.atexit, 'register', hooks.append)
+    profilers = [
+        profiling.CProfileProfiler(str(tmpdir.join(str(i))))
+        for i in range(2)
+    ]
+    # A single hook dumps all profilers.
+    assert hooks == [profiling._dump_profilers]
+    assert set(profilers) <= set(profiling._profilers)
+
+
+def test_tracemalloc_existing_traces(tmpdir):
+    from ..profiling import TracemallocProfiler
+    profiler = TracemallocProfiler(str(tmpdir.join('profile')))
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        # Allocated before the sample, while someone else is tracing.
+        existing = [object() for i in range(1000)]
+        profiler.run(lambda: None)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    assert len(existing) == 1000
+    assert __file__ not in {filename for filename, lineno in profiler._lines}
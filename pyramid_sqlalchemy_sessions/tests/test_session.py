@@ -1,3 +1,6 @@
+import logging
+import time
+
 import pytest
 import hypothesis.strategies as st
 from hypothesis import (
@@ -109,6 +112,8 @@ def test_session_matches_orm_mixins(settings, shared):
         _IdleSession,
         _ConfigAbsoluteSession,
         _AbsoluteSession,
+        _VersionSession,
+        _KeyValueDataSession,
         )
     with new_context(settings) as context:
         with new_request(context) as request:
@@ -120,6 +125,10 @@ def test_session_matches_orm_mixins(settings, shared):
                 assert isinstance(s, _CSRFSession)
             if shared['enable_configcookie']:
                 assert isinstance(s, _ConfigCookieSession)
+            if shared['enable_version']:
+                assert isinstance(s, _VersionSession)
+            if shared['enable_keyvalue']:
+                assert isinstance(s, _KeyValueDataSession)
             mixin_config_features = {
                 'config_renewal': (_ConfigRenewalSession, _RenewalSession),
                 'config_idle': (_ConfigIdleSession, _IdleSession),
@@ -141,6 +150,11 @@ def test_lazy_session(settings):
             assert getattr(request.session, '_session', None) == None
         with new_request(context) as request:
             assert 'test' not in request.session
+            assert request.session.get('test') is None
+            assert request.session.peek_flash() == []
+            # Reads without a session cookie use the null session.
+            assert request.session._session is None
+            assert request.session.new
             id = request.session._session.id
         with new_request(context) as request:
             assert_new_session(request, id)
@@ -156,6 +170,108 @@ def test_lazy_session(settings):
             assert_new_session(request, id2)
 
 
+@given(settings=valid_settings())
+def test_null_session(settings):
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            session = request.session
+            assert len(session) == 0
+            assert list(session.items()) == []
+            assert session.peek_flash() == []
+            assert session._session is None
+            assert not list(request.tm.get().getBeforeCommitHooks())
+            assert len(request.response_callbacks) == 1
+            with pytest.raises(TypeError):
+                session.data['test'] = 1
+            # The first write initializes the session.
+            session['test'] = 1
+            assert session._session is not None
+            assert len(request.response_callbacks) == 1
+            id = session._session.id
+        with new_request(context) as request:
+            assert request.session.get('test') == 1
+            assert request.session._session.id == id
+
+
+@given(settings=valid_settings())
+def test_deferred_new_session(settings):
+    with new_context(settings) as context:
+        context.set_cookie(
+            settings['cookie_name'], settings['cookie_path'],
+            settings['cookie_domain'], 'garbage', None, False, False,
+        )
+        with new_request(context) as request:
+            session = request.session
+            assert session.new
+            assert session.get('test') is None
+            assert session.peek_flash() == []
+        # Clean new session never creates a model instance.
+        assert session._instance is None
+        with new_request(context) as request:
+            session = request.session
+            session['test'] = 1
+            session.flash('message')
+            assert session._instance is None
+        assert session._instance is not None
+        with new_request(context) as request:
+            assert request.session['test'] == 1
+            assert request.session.pop_flash() == ['message']
+
+
+def test_log_level_flags(minimal_context, caplog):
+    logger_name = 'pyramid_sqlalchemy_sessions.session'
+    with caplog.at_level(logging.WARNING, logger=logger_name):
+        with new_request(minimal_context) as request:
+            request.session['test'] = 1
+            assert not request.session._log_info
+            assert not request.session._log_debug
+    assert not caplog.records
+    minimal_context._cookies = {}
+    with caplog.at_level(logging.DEBUG, logger=logger_name):
+        with new_request(minimal_context) as request:
+            request.session['test'] = 1
+            assert request.session._log_info
+            assert request.session._log_debug
+            id = request.session._session.id
+    messages = [record.getMessage() for record in caplog.records]
+    assert 'Creating new session %s' % id in messages
+    assert 'Running before commit TM hook' in messages
+
+
+def test_clock(minimal_settings):
+    from .model import IdleSessionModel
+    calls = []
+
+    def clock():
+        calls.append(1)
+        return 1000
+    settings = dict(minimal_settings, **{
+        'model_class': IdleSessionModel,
+        'idle_timeout': 300,
+        'clock': clock,
+    })
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            request.session['test'] = 1
+        assert len(calls) == 1
+        with new_request(context) as request:
+            assert request.session['test'] == 1
+            assert request.session.created == 1000
+            assert request.session._session.idle_expire == 1300
+        assert len(calls) == 2
+
+
+def test_CoarseClock():
+    from ..util import CoarseClock
+    clock = CoarseClock(resolution=0.01)
+    try:
+        now = clock()
+        assert abs(now - time.time()) <= 1
+        assert clock._now is not None
+    finally:
+        clock.stop()
+
+
 @pytest.mark.xfail(reason="May need some tweaking based on dialect.")
 @pytest.mark.parametrize(
     'isolation_level',
@@ -576,6 +692,44 @@ def test_renewal_timeout(settings, shared, new_settings):
         assert event_fired is True
 
 
+@pytest.mark.parametrize('core_persistence', [False, True])
+def test_hmac_renewal(minimal_settings, core_persistence):
+    from ..events import RenewalViolationEvent
+    from .model import HMACRenewalSessionModel
+    settings = dict(minimal_settings, **{
+        'model_class': HMACRenewalSessionModel,
+        'core_persistence': core_persistence,
+        'renewal_timeout': 60,
+    })
+    violations = []
+    with new_context(settings) as context:
+        context.config.add_subscriber(violations.append, RenewalViolationEvent)
+        with new_request(context) as request:
+            request.session['test'] = 1
+            id = request.session._session.id
+        start_cookies = context._cookies.copy()
+        context.time += 61
+        with new_request(context) as request:
+            assert_same_session(request, id)
+        assert context._cookies != start_cookies
+        # The candidate is sent again until acknowledged.
+        context._cookies = start_cookies
+        with new_request(context) as request:
+            assert_same_session(request, id)
+        assert context._cookies != start_cookies
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            assert request.session._session.renewal_epoch == 0
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            assert request.session._session.renewal_epoch == 1
+        assert not violations
+        context._cookies = start_cookies
+        with new_request(context) as request:
+            assert_new_session(request, id)
+        assert len(violations) == 1
+
+
 @given(
     settings=stable_extension_settings(),
     shared=shared_config(),
@@ -728,6 +882,66 @@ def test_idle_unstable_extension(settings, shared, new_settings):
             assert_same_session(request, id)
 
 
+def test_idle_hashed_extension(monkeypatch, minimal_settings):
+    from .model import IdleSessionModel
+    monkeypatch.setattr(
+        'pyramid_sqlalchemy_sessions.session.weighted_truth',
+        lambda percent: pytest.fail(),
+    )
+    settings = dict(minimal_settings, **{
+        'model_class': IdleSessionModel,
+        'idle_timeout': 1000,
+        'extension_bucket': 100,
+    })
+    start = 1000000
+    with new_context(settings, set_time=start) as context:
+        with new_request(context) as request:
+            request.session['test'] = 1
+        extended = set()
+        for t in range(start + 1, start + 301):
+            context.time = t
+            with new_request(context) as request:
+                assert 'test' in request.session
+                extended.add(request.session._session.idle_expire - 1000)
+        # Extended once per bucket, except the bucket it was created in.
+        assert sorted(t // 100 for t in extended) == [
+            start // 100,
+            start // 100 + 1,
+            start // 100 + 2,
+        ]
+
+
+@pytest.mark.parametrize('idle_timeout', [1801, 1000])
+def test_idle_hashed_extension_active(monkeypatch, minimal_settings,
+                                      idle_timeout):
+    from ..exceptions import ConfigurationError
+    from .model import IdleSessionModel
+    settings = dict(minimal_settings, **{
+        'model_class': IdleSessionModel,
+        'idle_timeout': idle_timeout,
+        'extension_bucket': 900,
+    })
+    if idle_timeout <= 1800:
+        with pytest.raises(ConfigurationError):
+            with new_context(settings) as context:
+                new_request(context).session
+        # As if the idle timeout was changed at runtime.
+        monkeypatch.setattr(
+            'pyramid_sqlalchemy_sessions.config._validate_extension_bucket',
+            lambda names, values: None,
+        )
+    start = 900000
+    with new_context(settings, set_time=start) as context:
+        with new_request(context) as request:
+            request.session['test'] = 1
+            id = request.session._session.id
+        # A user active across buckets stays logged in, whatever the slots.
+        for t in range(start, start + 20 * 900, 300):
+            context.time = t
+            with new_request(context) as request:
+                assert_same_session(request, id)
+
+
 @given(
     settings=valid_settings(),
     shared=shared_config(),
@@ -799,3 +1013,385 @@ def test_cookie(settings, shared, new_settings):
         assert value[1] == expire
         assert value[2] == new_settings['cookie_secure']
         assert value[3] == new_settings['cookie_httponly']
+
+
+@given(settings=valid_settings())
+def test_core_persistence(settings):
+    from ..core import SessionRecord
+    settings['core_persistence'] = True
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            request.session['test'] = 1
+            request.session.flash('msg')
+            id = request.session._session.id
+            assert isinstance(request.session._session, SessionRecord)
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            assert isinstance(request.session._session, SessionRecord)
+            assert len(request.dbsession.identity_map) == 0
+            request.session['box'] = set()
+        with new_request(context) as request:
+            assert request.session['box'] == set()
+            request.session['box'].add('cat')
+            request.session.changed()
+            assert request.session.pop_flash() == ['msg']
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            assert 'cat' in request.session['box']
+            assert request.session.peek_flash() == []
+            request.session.invalidate()
+            assert_new_session(request, id)
+        with new_request(context) as request:
+            assert_new_session(request, id)
+            cls = settings['model_class']
+            assert request.dbsession.query(cls).get(id) is None
+
+
+def test_persistence_engine(minimal_settings):
+    import os
+    import tempfile
+    from sqlalchemy import (
+        create_engine,
+        event,
+    )
+    settings = dict(minimal_settings, core_persistence=True)
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    url = 'sqlite:///' + path
+    engine = create_engine(url)
+    settings['persistence_engine'] = engine
+    app_statements = []
+
+    def fail():
+        raise RuntimeError
+
+    try:
+        with new_context(settings, url=url) as context:
+            event.listen(
+                context.engine,
+                'before_cursor_execute',
+                lambda *args: app_statements.append(args[2]),
+            )
+            with new_request(context) as request:
+                request.session['test'] = 1
+                id = request.session._session.id
+            # Session changes are committed by the session engine before
+            # the application transaction, and survive its failure.
+            with pytest.raises(RuntimeError):
+                with new_request(context) as request:
+                    request.session['test'] = 2
+                    request.tm.get().addBeforeCommitHook(fail)
+            with new_request(context) as request:
+                assert_same_session(request, id)
+                assert request.session['test'] == 2
+            assert app_statements == []
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+@pytest.mark.parametrize('flash_storage', ['session', 'cookie', 'cache'])
+@pytest.mark.parametrize('core_persistence', [False, True])
+def test_callback_persistence(minimal_settings, core_persistence,
+                              flash_storage):
+    from sqlalchemy.orm import sessionmaker
+    settings = dict(minimal_settings, **{
+        'persistence_mode': 'callback',
+        'core_persistence': core_persistence,
+        'flash_storage': flash_storage,
+    })
+    with new_context(settings) as context:
+        dbsession_factory = sessionmaker(bind=context.engine)
+
+        def run(view, exception=None):
+            request = new_request(context)
+            # No transaction manager.
+            request.tm = None
+            request.dbsession = dbsession_factory()
+            view(request)
+            request.exception = exception
+            request._process_response_callbacks(context)
+            request.dbsession.close()
+
+        def create(request):
+            request.session['test'] = 1
+            request.session.flash('msg')
+            ids.append(request.session._session.id)
+        ids = []
+        run(create)
+
+        def pop(request):
+            assert request.session.pop_flash() == ['msg']
+        run(pop)
+
+        def update(request):
+            assert_same_session(request, ids[0])
+            request.session['test'] = 2
+        run(update, exception=Exception())
+
+        def check(request):
+            assert_same_session(request, ids[0])
+            assert request.session['test'] == 1
+            assert request.session.peek_flash() == []
+            request.session.invalidate()
+        valid_cookies = dict(context._cookies)
+        run(check)
+
+        def check_invalidated(request):
+            assert_new_session(request, ids[0])
+        run(check_invalidated)
+
+        def check_created(request):
+            assert_same_session(request, ids[-1])
+
+        # New sessions replacing stale or invalid cookies are kept.
+        context._cookies = valid_cookies
+        run(create)
+        run(check_created)
+        context.set_cookie('session', '/', None, 'garbage', None, False, True)
+        run(create)
+        run(check_created)
+        assert len(set(ids)) == 3
+
+
+@given(settings=valid_settings())
+def test_statement_cache(settings):
+    from ..core import get_statements
+    settings['statement_cache'] = True
+    statements = get_statements(settings['model_class'])
+
+    def cache_sizes():
+        return len(statements.compiled_cache), len(statements.bakery.cache)
+
+    def session_cycle(context):
+        context._cookies = {}
+        with new_request(context) as request:
+            request.session['test'] = 1
+            id = request.session._session.id
+        for i in range(3):
+            with new_request(context) as request:
+                assert_same_session(request, id)
+                request.session['test'] = i
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            request.session.invalidate()
+
+    with new_context(settings) as context:
+        session_cycle(context)
+        sizes = cache_sizes()
+        assert sizes != (0, 0)
+        session_cycle(context)
+        assert cache_sizes() == sizes
+
+
+@given(
+    settings=valid_settings(),
+    shared=shared_config().filter(
+        lambda s: s['enable_version'] and not s['enable_keyvalue']
+    ),
+    resolve_theirs=st.booleans(),
+)
+def test_version_merge(settings, shared, resolve_theirs):
+    from ..exceptions import SessionConflictError
+    if resolve_theirs:
+        settings['conflict_resolver'] = lambda request, ours, theirs: theirs
+
+    def concurrent_requests(context, id, retries=None):
+        with new_request(context) as request1:
+            assert_same_session(request1, id, 'a')
+            if retries is not None:
+                request1.session._conflict_retries = retries
+            with new_request(context) as request2:
+                assert_same_session(request2, id, 'a')
+                request2.session['b'] = 2
+                request2.session['c'] = 2
+            request1.session['a'] = 3
+            del request1.session['b']
+
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            request.session.update({'a': 1, 'b': 1})
+            id = request.session._session.id
+        concurrent_requests(context, id)
+        with new_request(context) as request:
+            assert_same_session(request, id, 'a')
+            expected = {'a': 3, 'c': 2}
+            if resolve_theirs:
+                expected['b'] = 2
+            assert dict(request.session.items()) == expected
+            request.session.update({'a': 1, 'b': 1})
+        with pytest.raises(SessionConflictError):
+            concurrent_requests(context, id, retries=0)
+        with new_request(context) as request:
+            assert dict(request.session.items()) == {'a': 1, 'b': 2, 'c': 2}
+
+
+@given(
+    settings=valid_settings(),
+    shared=shared_config().filter(
+        lambda s: s['enable_version'] and not s['enable_keyvalue']
+    ),
+)
+def test_version_lazy_snapshot(settings, shared):
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            request.session.update({'a': 1, 'box': []})
+            id = request.session._session.id
+        with new_request(context) as request1:
+            with new_request(context) as request2:
+                # Reads of immutable values don't pickle anything.
+                assert_same_session(request2, id, 'a')
+                assert request2.session._data_snapshot == {}
+                request2.session['a'] = 2
+            # Mutable values are taken on read, before in-place changes.
+            request1.session['box'].append(1)
+            assert set(request1.session._data_snapshot) == {'box'}
+            request1.session.changed()
+            assert request1.session._snapshot_complete
+        with new_request(context) as request:
+            assert dict(request.session.items()) == {'a': 2, 'box': [1]}
+
+
+@given(
+    settings=valid_settings(),
+    shared=shared_config().filter(lambda s: s['enable_keyvalue']),
+)
+def test_keyvalue_data(settings, shared):
+    from sqlalchemy import event
+    table_name = settings['model_class'].data_table.name
+    writes = []
+
+    def record_writes(conn, cursor, statement, *args):
+        if table_name in statement and not statement.startswith('SELECT'):
+            writes.append(statement.split()[0])
+
+    with new_context(settings) as context:
+        event.listen(context.engine, 'before_cursor_execute', record_writes)
+        with new_request(context) as request:
+            request.session.update({'test': 1, 'box': [], 'gone': 1})
+            id = request.session._session.id
+        assert writes == ['INSERT']
+        del writes[:]
+        with new_request(context) as request:
+            assert not request.session.new
+            # Rows are loaded on first access to the data.
+            assert request.session.data._raw is None
+            assert_same_session(request, id)
+            request.session['box'].append(1)
+            request.session.changed()
+            del request.session['gone']
+        assert sorted(writes) == ['DELETE', 'UPDATE']
+        del writes[:]
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            assert dict(request.session.items()) == {'test': 1, 'box': [1]}
+        del writes[:]
+        with new_request(context) as request:
+            # Keys set before the rows are loaded can be deleted.
+            request.session['tmp'] = 1
+            assert request.session.data._raw is None
+            assert request.session.pop('tmp') == 1
+            request.session['tmp'] = 2
+            del request.session['tmp']
+            assert 'tmp' not in request.session
+        assert writes == []
+        with new_request(context) as request:
+            request.session['tmp'] = 1
+            request.session.clear()
+        assert writes == ['DELETE']
+        del writes[:]
+        with new_request(context) as request:
+            assert dict(request.session.items()) == {}
+            assert request.session._session.id == id
+            request.session.invalidate()
+        assert writes == ['DELETE']
+
+
+@given(
+    settings=valid_settings(),
+    flash_storage=st.sampled_from(('cookie', 'cache')),
+)
+def test_flash_storage(settings, flash_storage):
+    from sqlalchemy import event
+    # Disable features writing the row on reads.
+    settings.update({
+        'flash_storage': flash_storage,
+        'idle_timeout': None,
+        'renewal_timeout': None,
+    })
+    table_name = settings['model_class'].__tablename__
+    update = 'UPDATE %s ' % table_name
+    updates = []
+    flash_loads = []
+
+    def record_updates(conn, cursor, statement, *args):
+        if statement.startswith(update):
+            updates.append(statement)
+        elif '%s.flash' % table_name in statement:
+            flash_loads.append(statement)
+
+    with new_context(settings) as context:
+        event.listen(context.engine, 'before_cursor_execute', record_updates)
+        with new_request(context) as request:
+            request.session['test'] = 1
+            id = request.session._session.id
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            request.session.flash('msg')
+        with new_request(context) as request:
+            assert request.session.pop_flash() == ['msg']
+        with new_request(context) as request:
+            assert_same_session(request, id)
+            assert request.session.peek_flash() == []
+        assert updates == []
+        # The flash column isn't loaded.
+        assert flash_loads == []
+
+
+@given(settings=valid_settings())
+def test_metrics(settings):
+    from ..session import _MetricsSession
+    records = []
+
+    def metrics(request, name, duration, outcome):
+        assert duration is None or duration >= 0
+        records.append((name, outcome))
+
+    def recorded():
+        result = set(records)
+        del records[:]
+        return result
+
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            assert not isinstance(request.session, _MetricsSession)
+    settings['metrics'] = metrics
+    with new_context(settings) as context:
+        with new_request(context) as request:
+            request.session['test'] = 1
+            id = request.session._session.id
+        assert {
+            ('init', 'new'),
+            ('before_commit', 'created'),
+            ('cookie_dump', None),
+            ('after_commit', 'committed'),
+        } <= recorded()
+        with new_request(context) as request:
+            assert_same_session(request, id)
+        assert {
+            ('cookie_load', 'valid'),
+            ('load', 'hit'),
+            ('validate', 'valid'),
+            ('init', 'existing'),
+        } <= recorded()
+        with new_request(context) as request:
+            request.session.invalidate()
+        assert ('invalidate', 'invalidated') in recorded()
+        context._cookies = {}
+        context.set_cookie(
+            settings['cookie_name'], settings['cookie_path'],
+            settings['cookie_domain'], 'garbage', None, False, False,
+        )
+        with new_request(context) as request:
+            assert request.session.new
+        assert ('cookie_load', 'invalid') in recorded()
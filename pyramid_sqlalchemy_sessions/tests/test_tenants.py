@@ -0,0 +1,53 @@
+import pytest
+from pyramid.util import DottedNameResolver
+
+from .contexts import (
+    new_context,
+    new_request,
+)
+
+
+@pytest.fixture
+def tenant_registry(minimal_settings):
+    from ..tenants import SessionFactoryRegistry
+    from .model import AbsoluteSessionModel
+    registry = SessionFactoryRegistry(lambda request: request.tenant)
+    # Same model class, different timeouts.
+    for tenant, timeout in (('short', 100), ('long', 1000)):
+        settings = dict(minimal_settings, **{
+            'model_class': AbsoluteSessionModel,
+            'absolute_timeout': timeout,
+            'cookie_name': 'session_' + tenant,
+        })
+        registry.add_from_settings(
+            tenant,
+            settings,
+            DottedNameResolver().maybe_resolve,
+            '',
+        )
+    return registry
+
+
+def test_SessionFactoryRegistry(minimal_settings, tenant_registry):
+    from .model import AbsoluteSessionModel
+    settings = dict(minimal_settings, model_class=AbsoluteSessionModel)
+    tenants = ('short', 'long')
+    ids = {}
+    with new_context(settings) as context:
+        for tenant in tenants:
+            with new_request(context, tenant=tenant) as request:
+                session = tenant_registry(request)
+                session['test'] = 1
+                ids[tenant] = session._session.id
+        context.time += 200
+        for tenant in tenants:
+            with new_request(context, tenant=tenant) as request:
+                session = tenant_registry(request)
+                assert ('test' in session) == (tenant == 'long')
+                assert (session._session.id == ids[tenant]) != session.new
+        with pytest.raises(KeyError):
+            tenant_registry.get_factory(new_request(context, tenant='other'))
+        tenant_registry.default = 'long'
+        request = new_request(context, tenant='other')
+        assert tenant_registry.get_factory(request) is \
+            tenant_registry.factories['long']
@@ -1,4 +1,6 @@
+import os
 import random
+import threading
 import time
 
 
@@ -8,6 +10,61 @@ def weighted_truth(truth_percent):
     return truth_percent >= random.randint(1, 100)
 
 
+def probable_truth(probability):
+    """ Return True randomly with the probability from 0 to 1. """
+    return random.random() < probability
+
+
 def int_now():
     """Get the current time as UTC timestamp."""
     return int(time.time())
+
+
+class CoarseClock():
+    """
+    Clock returning the current UTC timestamp cached by a background thread,
+    which refreshes it every ``resolution`` seconds. Calls are attribute
+    reads, but the timestamp may lag by up to ``resolution`` seconds.
+
+    The thread is started on the first call in each process, so that the
+    clock keeps ticking in workers forked after its creation. Before Python
+    3.7, create the clock in the workers.
+    """
+    def __init__(self, resolution=1):
+        self.resolution = resolution
+        self._now = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if hasattr(os, 'register_at_fork'):
+            # Threads don't survive fork.
+            os.register_at_fork(after_in_child=self._reset)
+
+    def __call__(self):
+        now = self._now
+        if now is None:
+            now = self._start()
+        return now
+
+    def _start(self):
+        with self._lock:
+            if self._now is None:
+                self._now = int_now()
+                thread = threading.Thread(
+                    target=self._tick,
+                    name='session-clock',
+                    daemon=True,
+                )
+                thread.start()
+            return self._now
+
+    def _tick(self):
+        while not self._stop.wait(self.resolution):
+            self._now = int_now()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._now = None
+
+    def stop(self):
+        """ Stop the background thread. """
+        self._stop.set()